@@ -0,0 +1,321 @@
+# api_server.py serves the perfume finder as a JSON API (filter, similar scents and shop lookups) for the mobile client and partners
+#
+# Run it:   python api_server.py --port 8000 --workers 4
+#
+# Endpoints (GET with query parameters, POST with a JSON body; every POST also accepts a batch, where a bad item
+# gets its own {"error": ...} entry):
+#   GET  /health                                  -> {"status": "ok", "perfumes": 135}
+#   GET  /options                                 -> sidebar values per filter
+#   GET  /filter?gender=Female&price=High&page=0&page_size=20&sort=-price
+#   POST /filter   {"filters": {...}, "page": 0, "page_size": 20, "sort": "name"}  or  {"queries": [{...}, ...]}
+#   GET  /similar/{name}?k=3
+#   POST /similar  {"names": ["Sauvage", "Libre"], "k": 3}
+#   GET  /shops?name=Sauvage&location=Zurich
+#   POST /shops    {"names": ["Sauvage", "Libre"], "location": "Zurich"}
+#   GET  /metrics                                 -> Prometheus text (stage timings and counters; needs PERFUME_DEBUG=1,
+#                                                    and every worker process reports its own totals)
+
+import argparse        # Import argparse to read the command-line options
+import contextlib        # Import contextlib for the no-op recording when debugging is off
+import json        # Import json to read requests and write responses
+import os        # Import os to fork the worker processes
+import signal        # Import signal to pass a shutdown on to the workers
+import socket        # Import socket to share one listening socket between the workers
+import sys        # Import sys to detect platforms without fork
+import time        # Import time to report how long a request took
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer        # Import the standard-library threaded HTTP server
+from urllib.parse import parse_qs, unquote, urlparse        # Import helpers to read paths and query strings
+
+import instrumentation
+from catalog import CATALOG_PATH, load_catalog
+from filter_index import ALL, FILTER_COLUMNS
+from shop_finder_api import find_shops_cached, find_shops_many
+
+# Sort parameter of /filter -> (column, descending) as used by Catalog.page()
+API_SORTS = {
+    'catalog': None,
+    'name': ('name', False),
+    'price': ('price', False),
+    '-price': ('price', True),
+}
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_BATCH = 100        # Largest number of queries, names or lookups accepted in one request
+MAX_BODY = 1 << 20        # Largest POST body in bytes (a full batch is a few kB)
+
+catalog = None        # Loaded once per process in main(), before the workers are forked
+DEBUG = instrumentation.debug_enabled()        # PERFUME_DEBUG=1 records every request
+
+
+class ApiError(Exception):
+    """A client error, answered with its HTTP status and message."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _int(value, name, default, low, high):
+    # Parse an integer parameter and check its range
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ApiError(f"{name} must be an integer")
+    if not low <= number <= high:
+        raise ApiError(f"{name} must be between {low} and {high}")
+    return number
+
+
+def _text(value, name):
+    # Check a value that must be a string (a list or object would otherwise fail deep inside a lookup)
+    if not isinstance(value, str):
+        raise ApiError(f"{name} must be a string")
+    return value
+
+
+def _batch(items, name):
+    if not isinstance(items, list) or not items:
+        raise ApiError(f"{name} must be a non-empty list")
+    if len(items) > MAX_BATCH:
+        raise ApiError(f"at most {MAX_BATCH} {name} per request")
+    return items
+
+
+def _each(items, answer):
+    # Answer every item of a batch; a bad item gets its own error instead of failing the whole batch
+    results = []
+    for item in items:
+        try:
+            results.append(answer(item))
+        except ApiError as e:
+            results.append({'error': str(e), 'status': e.status})
+    return results
+
+
+@instrumentation.timed("run_filter")
+def run_filter(query):
+    """
+    Answers one filter query.
+
+    Args:
+        query (dict): {"filters": {key: value}, "page": int, "page_size": int, "sort": str}.
+            Filter keys may also be given at the top level (as in a GET query string).
+
+    Returns:
+        dict: {"total": matches, "page": ..., "page_size": ..., "results": [perfume, ...]}.
+    """
+    if not isinstance(query, dict):
+        raise ApiError("a query must be a JSON object")
+    filters = query.get('filters', {key: query[key] for key in FILTER_COLUMNS if key in query})
+    if not isinstance(filters, dict):
+        raise ApiError("filters must be a JSON object")
+    unknown = set(filters) - set(FILTER_COLUMNS)
+    if unknown:
+        raise ApiError(f"unknown filters: {', '.join(sorted(unknown))} (use {', '.join(FILTER_COLUMNS)})")
+    for key, value in filters.items():
+        _text(value, f"filter {key}")
+    sort = query.get('sort', 'catalog')
+    if not isinstance(sort, str) or sort not in API_SORTS:
+        raise ApiError(f"sort must be one of {', '.join(API_SORTS)}")
+    page = _int(query.get('page'), "page", 0, 0, 10 ** 9)
+    page_size = _int(query.get('page_size'), "page_size", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    filters = {key: filters.get(key, ALL) for key in FILTER_COLUMNS}
+    rows = catalog.filter_index.query(filters)
+    page_rows = catalog.page(rows, API_SORTS[sort], page, page_size)
+    return {'total': int(len(rows)), 'page': page, 'page_size': page_size, 'results': catalog.records(page_rows)}
+
+
+@instrumentation.timed("run_similar")
+def run_similar(name, k):
+    """Returns the perfumes most similar to the perfume with the given name."""
+    row = catalog.find(_text(name, "name"))
+    if row is None:
+        raise ApiError(f"unknown perfume: {name}", status=404)
+    similar = catalog.similarity.similar_to_row(row, k)
+    return {'name': name, 'similar': catalog.records(similar)}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Routes the API requests; every request runs in its own thread."""
+
+    protocol_version = "HTTP/1.1"        # Keep connections alive between requests
+    disable_nagle_algorithm = True        # Send small answers at once instead of waiting for the client's delayed ACK
+    server_version = "PerfumeFinderAPI/1.0"
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip("/") or "/"
+        route = "/" + path.split("/")[1]        # /similar/Sauvage is recorded as /similar
+        # With PERFUME_DEBUG=1 every request is recorded (stage timings and counters for /metrics)
+        recording = instrumentation.recording(f"{method} {route}") if DEBUG and path != "/metrics" else contextlib.nullcontext()
+        try:
+            with recording:
+                body = self._body() if method == "POST" else None
+                status, payload = 200, self._route(method, path, params, body)
+        except ApiError as e:
+            status, payload = e.status, {'error': str(e)}
+        except Exception as e:        # Never let one bad request take the worker down
+            status, payload = 500, {'error': f"internal error: {e}"}
+        self._send(status, payload, time.perf_counter() - start)
+
+    def _body(self):
+        try:
+            length = _int(self.headers.get("Content-Length") or None, "Content-Length", 0, 0, MAX_BODY)
+        except ApiError:
+            self.close_connection = True        # The body was not read, so the rest of the connection cannot be parsed
+            raise
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError("the request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise ApiError("the request body must be a JSON object")
+        return body
+
+    def _route(self, method, path, params, body):
+        if path == "/health":
+            return {'status': 'ok', 'perfumes': len(catalog.df), 'pid': os.getpid()}
+        if path == "/options":
+            return catalog.options
+        if path == "/metrics":
+            return instrumentation.prometheus_text()
+        if path == "/filter":
+            if method == "GET":
+                return run_filter(params)
+            if 'queries' in body:
+                return {'results': _each(_batch(body['queries'], "queries"), run_filter)}
+            return run_filter(body)
+        if path == "/similar" or path.startswith("/similar/"):
+            k = _int((body or params).get('k'), "k", 3, 1, 50)
+            if method == "GET":
+                name = unquote(path[len("/similar/"):]) if path.startswith("/similar/") else params.get('name')
+                if not name:
+                    raise ApiError("use /similar/{name}")
+                return run_similar(name, k)
+            names = _batch(body.get('names'), "names")
+            return {'results': _each(names, lambda name: run_similar(name, k))}
+        if path == "/shops":
+            if method == "GET":
+                if not params.get('name'):
+                    raise ApiError("name is required")
+                location = params.get('location', "Zurich")
+                with instrumentation.span("find_shops"):
+                    shops = find_shops_cached(params['name'], location)
+                return {'name': params['name'], 'location': location, 'shops': shops}
+            names = _batch(body.get('names'), "names")
+            location = _text(body.get('location', "Zurich"), "location")
+            shops = find_shops_many([name for name in names if isinstance(name, str)], location)        # Concurrent, cached, with an overall deadline
+            return {'location': location, 'results': [
+                {'name': name, 'shops': shops.get(name)} if isinstance(name, str)
+                else {'name': name, 'error': "name must be a string", 'status': 400}        # A bad item gets its own error, like in _each()
+                for name in names
+            ]}
+        raise ApiError(f"no such endpoint: {method} {path}", status=404)
+
+    def _send(self, status, payload, elapsed):
+        if isinstance(payload, str):        # /metrics answers in the Prometheus text format
+            data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            data, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Server-Timing", f"app;dur={elapsed * 1000:.2f}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):        # Access logs would dominate the cost of the fast endpoints
+        pass
+
+
+def serve(host="127.0.0.1", port=8000, workers=1, path=CATALOG_PATH):
+    """
+    Loads the catalog and serves the API.
+
+    With workers > 1 the listening socket is opened once and the process forks: every
+    worker serves requests from the same socket with its own threads, while the catalog
+    loaded before the fork (memory-mapped from its snapshot) is shared between them.
+    Stopping the parent (SIGTERM or Ctrl+C) stops the workers, and it returns once they have exited.
+    """
+    global catalog
+    catalog = load_catalog(path)
+    catalog.find("")        # Build the name lookup before forking so the workers share it
+    catalog.table        # Same for the record table the responses are decoded from
+    server = ThreadingHTTPServer((host, port), ApiHandler, bind_and_activate=False)
+    server.daemon_threads = True
+    server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.server_bind()
+    server.server_activate()
+    print(f"Perfume API on http://{host}:{server.server_address[1]} ({len(catalog.df)} perfumes, {workers} worker(s))")
+    if workers <= 1 or not hasattr(os, "fork"):
+        if workers > 1:
+            print("This platform cannot fork; running a single worker.", file=sys.stderr)
+        _serve_forever(server)
+        return
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:        # Worker process
+            _serve_forever(server)
+            os._exit(0)
+        children.append(pid)
+    signal.signal(signal.SIGTERM, lambda signum, frame: _stop(children))        # Installed after forking, so the workers keep the default
+    try:
+        _wait(children)
+    except KeyboardInterrupt:        # Ctrl+C reaches the workers as well; make sure they are gone before returning
+        _stop(children)
+        _wait(children)
+
+
+def _stop(children):
+    # Ask every worker still running to terminate
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def _wait(children):
+    # Wait for the workers to exit, removing each one from the list once it is reaped
+    while children:
+        try:
+            os.waitpid(children[0], 0)
+        except ChildProcessError:
+            pass
+        children.pop(0)
+
+
+def _serve_forever(server):
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON API of the perfume finder.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes sharing the socket")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="catalog CSV to serve")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.catalog)
+
+
+if __name__ == "__main__":
+    main()
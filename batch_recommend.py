@@ -0,0 +1,254 @@
+# batch_recommend.py to rank the catalog for a whole file of customer profiles (offline, e.g. for a mailing)
+#
+# Run it:   python batch_recommend.py profiles.csv recommendations.jsonl --top 10 --workers 4
+#           python batch_recommend.py profiles.jsonl recommendations.jsonl --require gender price
+#           python batch_recommend.py profiles.csv recommendations.jsonl --resume        (continue an interrupted run)
+#
+# A profile holds one preferred value (or none) per sidebar filter, by filter key or column name, with the
+# values spelled exactly as in the catalog (like the sidebar and /filter match them):
+#   id;gender;scent_direction;season;personality;occasion;price;brand            (CSV, ";" or "," separated)
+#   {"id": "c-17", "gender": "Female", "scent": "Floral", "price": "High"}        (JSON lines)
+# Every profile gets one output line, in input order:
+#   {"id": "c-17", "recommendations": [{"rank": 1, "name": "...", "brand": "...", "score": 3}, ...]}
+# or {"id": ..., "error": "..."} when the profile cannot be read. So the number of lines in the output is
+# the number of profiles done, which is what --resume continues from.
+
+import argparse        # Import argparse to read the command-line options
+import csv        # Import csv to stream CSV profiles
+import itertools        # Import itertools to cut the profile stream into chunks
+import json        # Import json to read JSON-lines profiles and write the results
+import multiprocessing        # Import multiprocessing for the worker processes
+import os        # Import os for the CPU count and the output file size
+import sys        # Import sys for stdin/stdout and the progress lines
+import time        # Import time for the progress rate
+from collections import deque        # Import deque for the chunks in flight
+
+import numpy as np        # Import NumPy to stack the encoded profiles of a chunk
+
+from catalog import CATALOG_PATH, SNAPSHOT_DIR, read_catalog_frame
+from filter_index import FilterIndex
+from profile_match import ProfileMatcher
+from records import CatalogTable
+
+TOP_N = 10        # Perfumes recommended per profile
+CHUNK_SIZE = 512        # Profiles scored together (and sent to a worker as one task)
+IN_FLIGHT = 2        # Chunks per worker queued or running at a time; bounds the memory whatever the input size
+PROGRESS_EVERY = 5.0        # Seconds between progress lines
+ID_FIELD = "id"        # Profile field copied to the output (the input position when missing)
+JSON_SUFFIXES = (".jsonl", ".ndjson", ".json")
+
+_matcher = None        # Per worker process: ProfileMatcher of the catalog
+_table = None        # Per worker process: CatalogTable of the catalog, to decode the recommended rows
+
+
+def init_worker(path=CATALOG_PATH, snapshot_dir=SNAPSHOT_DIR, top_n=TOP_N, required=()):
+    """
+    Loads the catalog into this process (once).
+
+    The codes of the catalog frame are memory-mapped from its snapshot, so all workers
+    share those pages; the filter index and the table read them without copying. The
+    matcher's own arrays are built per process, unless the pool forks and inherits the
+    one built by the parent.
+    """
+    global _matcher, _table
+    if _matcher is not None:
+        return
+    df = read_catalog_frame(path, snapshot_dir)
+    _matcher = ProfileMatcher(FilterIndex(df), top_n, required)
+    _table = CatalogTable(df)
+
+
+def read_profiles(source, fmt=None):
+    """
+    Streams the profiles of a CSV or JSON-lines file (or stdin for '-').
+
+    Args:
+        source (str): Path of the profile file, or '-' for stdin.
+        fmt (str): 'csv' or 'jsonl'; guessed from the file suffix if None.
+
+    Yields:
+        dict or str: A CSV profile, or the raw line of a JSON profile (parsed by the worker).
+    """
+    if fmt is None:
+        fmt = "jsonl" if source.lower().endswith(JSON_SUFFIXES) else "csv"
+    f = sys.stdin if source == "-" else open(source, newline="", encoding="utf-8-sig")
+    try:
+        if fmt == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield line
+            return
+        header = f.readline()
+        delimiter = ";" if header.count(";") >= header.count(",") else ","        # Perfumes.csv uses ";"
+        fields = next(csv.reader([header], delimiter=delimiter), [])
+        for row in csv.DictReader(f, fieldnames=[name.strip() for name in fields], delimiter=delimiter):
+            yield row
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def recommend_chunk(items, start):
+    """
+    Ranks the catalog for one chunk of profiles (runs in a worker).
+
+    Args:
+        items (list): Profiles from read_profiles().
+        start (int): Input position of the first profile.
+
+    Returns:
+        tuple: (output lines as one string, number of profiles that could not be read).
+    """
+    profiles, errors = [], {}
+    for i, item in enumerate(items):
+        try:
+            profile = json.loads(item) if isinstance(item, str) else item
+            if not isinstance(profile, dict):
+                raise ValueError("a profile must be a JSON object")
+        except ValueError as e:
+            profile, errors[i] = {}, f"invalid profile: {e}"
+        profiles.append(profile)
+    results = _matcher.match(np.stack([_matcher.encode(p) for p in profiles])) if profiles else []
+    lines = []
+    for i, (profile, (rows, scores)) in enumerate(zip(profiles, results)):
+        line = {'id': profile.get(ID_FIELD, start + i)}
+        if i in errors:
+            line['error'] = errors[i]
+        else:
+            line['recommendations'] = [
+                {'rank': rank, 'name': name, 'brand': brand, 'score': score}
+                for rank, (name, brand, score) in enumerate(
+                    zip(_table.column('name', rows), _table.column('brand', rows), scores.tolist()), start=1)
+            ]
+        lines.append(json.dumps(line, ensure_ascii=False) + "\n")
+    return "".join(lines), len(errors)
+
+
+def profiles_done(output):
+    """
+    Returns the number of complete lines in an output file, cutting off a last line that
+    an interrupted run left half-written.
+    """
+    if not os.path.exists(output):
+        return 0
+    done, end = 0, 0        # end: size up to the last newline
+    with open(output, "rb") as f:
+        position = 0
+        for block in iter(lambda: f.read(1 << 20), b""):
+            done += block.count(b"\n")
+            last = block.rfind(b"\n")
+            if last >= 0:
+                end = position + last + 1
+            position += len(block)
+    if end < position:
+        with open(output, "r+b") as f:
+            f.truncate(end)
+    return done
+
+
+def run(source, output, path=CATALOG_PATH, top_n=TOP_N, required=(), workers=None, chunk_size=CHUNK_SIZE,
+        start_offset=0, resume=False, fmt=None, progress=sys.stderr):
+    """
+    Ranks the catalog for every profile of a file and streams the results to an output file.
+
+    Chunks of profiles are scored by a pool of worker processes, at most IN_FLIGHT chunks
+    per worker at a time, and written in input order as soon as they are ready.
+
+    Args:
+        source (str): Profile file (CSV or JSON lines), or '-' for stdin.
+        output (str): Output JSON-lines file, or '-' for stdout.
+        path (str): Path of the catalog CSV.
+        top_n (int): Perfumes recommended per profile.
+        required (iterable): Filter keys a recommendation must match (when the profile sets them).
+        workers (int): Worker processes (default: one per CPU; 0 scores in this process).
+        chunk_size (int): Profiles per task.
+        start_offset (int): Profiles to skip at the start of the input.
+        resume (bool): Append to the output, skipping the profiles it already holds.
+        fmt (str): 'csv' or 'jsonl'; guessed from the file suffix if None.
+        progress: Stream for the progress lines (None for quiet).
+
+    Returns:
+        dict: profiles, errors, seconds and profiles_per_s of this run, and the input offset it started at.
+    """
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    offset = start_offset
+    if resume and output != "-":
+        offset += profiles_done(output)
+    init_worker(path, SNAPSHOT_DIR, top_n, tuple(required))        # Builds the snapshot once and, with fork, the workers' matcher
+    profiles = itertools.islice(read_profiles(source, fmt), offset, None)
+
+    pool = None
+    if workers > 0:
+        pool = multiprocessing.get_context().Pool(workers, init_worker, (path, SNAPSHOT_DIR, top_n, tuple(required)))
+    out = sys.stdout if output == "-" else open(output, "a" if resume else "w", encoding="utf-8")
+    done, errors = 0, 0
+    started = last_report = time.perf_counter()
+    pending = deque()
+
+    def write(result):
+        nonlocal done, errors, last_report
+        text, failed = result
+        out.write(text)
+        out.flush()        # Everything written is complete, so an interrupted run can resume after it
+        done += text.count("\n")
+        errors += failed
+        now = time.perf_counter()
+        if progress is not None and now - last_report >= PROGRESS_EVERY:
+            last_report = now
+            print(f"{offset + done} profiles done ({done / (now - started):.0f}/s)", file=progress, flush=True)
+
+    try:
+        position = offset
+        while True:
+            chunk = list(itertools.islice(profiles, chunk_size))
+            if not chunk:
+                break
+            if pool is None:
+                write(recommend_chunk(chunk, position))
+            else:
+                pending.append(pool.apply_async(recommend_chunk, (chunk, position)))
+                if len(pending) >= workers * IN_FLIGHT:
+                    write(pending.popleft().get())
+            position += len(chunk)
+        while pending:
+            write(pending.popleft().get())
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if out is not sys.stdout:
+            out.close()
+    seconds = time.perf_counter() - started
+    summary = {'start_offset': offset, 'profiles': done, 'errors': errors, 'seconds': round(seconds, 2),
+               'profiles_per_s': round(done / seconds, 1) if seconds > 0 else None}
+    if progress is not None:
+        print(f"Done: {done} profiles ({errors} unreadable) in {seconds:.1f}s, starting at profile {offset}",
+              file=progress, flush=True)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommend perfumes for a file of customer profiles.")
+    parser.add_argument("profiles", help="CSV or JSON-lines profile file ('-' for stdin)")
+    parser.add_argument("output", help="JSON-lines output file ('-' for stdout)")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="catalog CSV")
+    parser.add_argument("--top", type=int, default=TOP_N, help="perfumes per profile")
+    parser.add_argument("--require", nargs="+", default=[], metavar="FILTER",
+                        help="filters a recommendation must match, e.g. gender price")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU, 0: none)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--start-offset", type=int, default=0, help="profiles to skip at the start of the input")
+    parser.add_argument("--resume", action="store_true", help="append to the output, skipping the profiles it holds")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="profile format (default: from the file suffix)")
+    args = parser.parse_args()
+    try:
+        run(args.profiles, args.output, args.catalog, args.top, args.require, args.workers, args.chunk_size,
+            args.start_offset, args.resume, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print("Interrupted; run again with --resume to continue.", file=sys.stderr)
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
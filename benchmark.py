@@ -0,0 +1,303 @@
+# benchmark.py to time the hot paths of the perfume finder on synthetic catalogs of growing size
+#
+# Run it:   python benchmark.py                                  (1k, 100k and 1M perfumes, compared with the stored baseline)
+#           python benchmark.py --sizes 1000 100000              (only some sizes)
+#           python benchmark.py --update-baseline                (store the current numbers as the new baseline)
+#
+# The run fails (exit code 1) and prints the differences when a hot path got slower or needs
+# more memory than its baseline allows.
+
+import argparse        # Import argparse to read the command-line options
+import gc        # Import gc to start every measurement from a collected heap
+import json        # Import json to read and write the baselines
+import math        # Import math for the scaling exponents
+import os        # Import os to find the baseline file next to this script
+import platform        # Import platform to record where a baseline was measured
+import sys        # Import sys for the exit code
+import time        # Import time for the timings
+import tracemalloc        # Import tracemalloc to measure the peak memory of every hot path
+
+import numpy as np        # Import NumPy for the seeded random inputs
+import pandas as pd        # Import pandas to record its version with the baseline
+
+from catalog import SIMILAR_K, SORT_OPTIONS, Catalog, price_chart_data
+from filter_index import ALL, FILTER_COLUMNS
+from synthetic_catalog import generate_catalog
+
+SIZES = (1_000, 100_000, 1_000_000)        # Catalog sizes of a full run
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+TIME_TOLERANCE = 0.5        # A hot path may get 50% slower than its baseline before the run fails
+MEMORY_TOLERANCE = 0.25        # ... and need 25% more memory
+MIN_TIME_CHANGE_MS = 0.05        # Smaller differences are timer noise, whatever the percentage
+MIN_MEMORY_CHANGE_MB = 1.0        # Smaller differences are allocator noise
+OPS = 200        # Inputs per measured round
+ROUNDS = 5        # Rounds per hot path; the fastest one counts (the others were disturbed by something else)
+PAGE_SIZE = 25        # Perfumes per result page (as in the app)
+
+
+def random_filters(catalog, rng):
+    # One to three sidebar choices, like a user narrowing down the results
+    keys = list(FILTER_COLUMNS)
+    chosen = rng.choice(len(keys), size=rng.integers(1, 4), replace=False)
+    filters = {key: ALL for key in keys}
+    for i in chosen:
+        values = catalog.options[keys[i]]
+        filters[keys[i]] = values[rng.integers(len(values))]
+    return filters
+
+
+# Every hot path: name -> (setup(catalog, rng) returning the inputs, run(catalog, input))
+def _filter_setup(catalog, rng):
+    sorts = list(SORT_OPTIONS.values())
+    return [(random_filters(catalog, rng), sorts[rng.integers(len(sorts))]) for _ in range(OPS)]
+
+
+def _filter_run(catalog, query):
+    # filter_perfumes() followed by the first result page (display_results)
+    filters, sort = query
+    rows = catalog.filter_index.query(filters)
+    return catalog.page(rows, sort, 0, PAGE_SIZE)
+
+
+def _similar_setup(catalog, rng):
+    return rng.integers(len(catalog.df), size=OPS).tolist()
+
+
+def _similar_run(catalog, row):
+    # get_similar_perfumes_tagmatch(): the precomputed neighbours, and the fields the app shows for them
+    similar = catalog.results(catalog.similarity.similar_to_row(row, SIMILAR_K))
+    return [(p['name'], p['brand'], p['scent_direction']) for p in similar]
+
+
+def _similar_scan_setup(catalog, rng):
+    return list(catalog.results(rng.integers(len(catalog.df), size=OPS // 10)))
+
+
+def _similar_scan_run(catalog, perfume):
+    # A perfume without precomputed neighbours is scored against the whole catalog
+    return catalog.similarity.top_k(perfume, SIMILAR_K)
+
+
+def _sidebar_setup(catalog, rng):
+    return [random_filters(catalog, rng) for _ in range(OPS)]
+
+
+def _sidebar_run(catalog, current):
+    # render_sidebar_filters(): facet counts and the options that still give results
+    counts = catalog.facets.options(current, catalog.options)
+    return {
+        key: [ALL] + [value for value in values if counts[key][value] > 0 or value == current[key]]
+        for key, values in catalog.options.items()
+    }
+
+
+def _price_chart_setup(catalog, rng):
+    return [catalog.results(rng.integers(len(catalog.df), size=PAGE_SIZE)) for _ in range(OPS // 10)]        # What display_results() hands to the chart
+
+
+def _price_chart_run(catalog, perfumes):
+    return price_chart_data(perfumes)
+
+
+def _notes_containing_setup(catalog, rng):
+    vocabulary = catalog.notes.vocabulary        # Builds the notes index outside the measurement
+    return [([vocabulary[i] for i in rng.integers(len(vocabulary), size=2)], "all" if op % 2 else "any")
+            for op in range(OPS)]
+
+
+def _notes_containing_run(catalog, query):
+    notes, match = query
+    return catalog.notes.containing(notes, match)
+
+
+def _notes_similar_setup(catalog, rng):
+    return rng.integers(len(catalog.df), size=OPS // 10).tolist()
+
+
+def _notes_similar_run(catalog, row):
+    # Perfumes with the most similar note profile; the common notes of a perfume make this linear in the catalog size
+    return catalog.notes.similar(row, SIMILAR_K)
+
+
+HOT_PATHS = {
+    'filter': (_filter_setup, _filter_run),
+    'similar': (_similar_setup, _similar_run),
+    'similar_scan': (_similar_scan_setup, _similar_scan_run),
+    'sidebar_options': (_sidebar_setup, _sidebar_run),
+    'price_chart_data': (_price_chart_setup, _price_chart_run),
+    'notes_containing': (_notes_containing_setup, _notes_containing_run),
+    'notes_similar': (_notes_similar_setup, _notes_similar_run),
+}
+
+
+def measure(function, inputs, rounds=ROUNDS):
+    """
+    Times a function over a list of inputs and measures its peak memory.
+
+    Returns:
+        tuple: (seconds per call of the fastest round, peak memory in MB above the
+        memory in use before the calls).
+    """
+    best = math.inf
+    for _ in range(rounds):
+        gc.collect()
+        start = time.perf_counter()
+        for item in inputs:
+            function(item)
+        best = min(best, (time.perf_counter() - start) / len(inputs))
+    gc.collect()
+    tracemalloc.start()        # Traced separately, since tracing slows the calls down
+    base = tracemalloc.get_traced_memory()[0]
+    for item in inputs:
+        function(item)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return best, peak / 2 ** 20
+
+
+def run_size(size, seed=0, paths=None, log=print):
+    """
+    Benchmarks every hot path on a synthetic catalog of one size.
+
+    Returns:
+        dict: Hot path -> {'ms_per_op', 'ops_per_s', 'rows_per_s', 'peak_mb'}.
+    """
+    df = generate_catalog(size, seed)
+    results = {}
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    catalog = Catalog(df)        # Filter bitmaps, facet totals and the precomputed similar perfumes
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results['catalog_build'] = _result(size, elapsed, peak / 2 ** 20)
+    log(f"  {size:>9} catalog_build     {elapsed * 1000:10.1f} ms")
+    rng = np.random.default_rng(seed)
+    for name, (setup, run) in HOT_PATHS.items():
+        if paths and name not in paths:
+            continue
+        inputs = setup(catalog, rng)
+        seconds, peak_mb = measure(lambda item: run(catalog, item), inputs)
+        results[name] = _result(size, seconds, peak_mb)
+        log(f"  {size:>9} {name:<17} {seconds * 1000:10.3f} ms")
+    return results
+
+
+def _result(size, seconds, peak_mb):
+    return {
+        'ms_per_op': round(seconds * 1000, 4),
+        'ops_per_s': round(1 / seconds, 1) if seconds > 0 else None,
+        'rows_per_s': round(size / seconds) if seconds > 0 else None,        # Catalog rows covered per second
+        'peak_mb': round(peak_mb, 2),
+    }
+
+
+def report(results):
+    """Prints one table per hot path with the throughput, the memory and the scaling exponent between sizes."""
+    paths = sorted({name for per_size in results.values() for name in per_size}, key=lambda n: (n != 'catalog_build', n))
+    sizes = sorted(results, key=int)
+    for name in paths:
+        print(f"\n{name}")
+        print(f"  {'rows':>9} {'ms/op':>10} {'ops/s':>11} {'rows/s':>14} {'peak MB':>9} {'scaling':>8}")
+        previous = None
+        for size in sizes:
+            row = results[size].get(name)
+            if row is None:
+                continue
+            # Exponent b of time ~ rows^b since the previous size (0 = constant, 1 = linear)
+            scaling = ""
+            if previous is not None and previous[1] > 0 and row['ms_per_op'] > 0:
+                scaling = f"{math.log(row['ms_per_op'] / previous[1]) / math.log(int(size) / int(previous[0])):.2f}"
+            print(f"  {int(size):>9} {row['ms_per_op']:>10.3f} {row['ops_per_s'] or 0:>11.1f} {row['rows_per_s'] or 0:>14,}"
+                  f" {row['peak_mb']:>9.2f} {scaling:>8}")
+            previous = (size, row['ms_per_op'])
+
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """
+    Compares a run with a baseline.
+
+    Returns:
+        list: One (hot path, size, metric, baseline value, current value) per regression.
+    """
+    regressions = []
+    for size, per_path in results.items():
+        for name, current in per_path.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            if (current['ms_per_op'] > base['ms_per_op'] * (1 + time_tolerance)
+                    and current['ms_per_op'] - base['ms_per_op'] > MIN_TIME_CHANGE_MS):
+                regressions.append((name, size, 'ms_per_op', base['ms_per_op'], current['ms_per_op']))
+            if (current['peak_mb'] > base['peak_mb'] * (1 + memory_tolerance)
+                    and current['peak_mb'] - base['peak_mb'] > MIN_MEMORY_CHANGE_MB):
+                regressions.append((name, size, 'peak_mb', base['peak_mb'], current['peak_mb']))
+    return regressions
+
+
+def environment():
+    """Describes the machine and library versions a baseline was measured with."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the perfume finder hot paths on synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="catalog sizes (rows)")
+    parser.add_argument("--paths", nargs="+", choices=list(HOT_PATHS), help="only these hot paths")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    parser.add_argument("--out", help="also write the results of this run to a JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = run_size(size, args.seed, args.paths)        # JSON keys are strings
+    report(results)
+    run = {'environment': environment(), 'seed': args.seed, 'results': results}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.update_baseline:
+        if baseline is not None:        # Keep the sizes that were not run this time
+            for size, per_path in baseline['results'].items():
+                for name, values in per_path.items():
+                    results.setdefault(size, {}).setdefault(name, values)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one.")
+        return
+    if baseline.get('environment') != run['environment']:
+        print(f"\nNote: the baseline was measured on {baseline.get('environment')}, this run on {run['environment']}.")
+    regressions = compare(results, baseline['results'], args.time_tolerance, args.memory_tolerance)
+    if not regressions:
+        print("\nNo regressions against the baseline.")
+        return
+    print(f"\n{len(regressions)} regression(s) against the baseline:")
+    print(f"  {'hot path':<17} {'rows':>9} {'metric':<10} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, size, metric, before, now in regressions:
+        change = f"{(now / before - 1) * 100:+.0f}%" if before else "new"
+        print(f"  {name:<17} {int(size):>9} {metric:<10} {before:>10.3f} {now:>10.3f} {change:>8}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+# catalog.py to load the perfume catalog once per process and share it (with its indexes) across all app sessions
+
+import hashlib        # Import hashlib to fingerprint the CSV contents
+import json        # Import json to store the snapshot metadata and string dictionaries
+import os        # Import os for file timestamps and atomic file replacement
+import threading        # Import threading so concurrent sessions build the catalog only once
+
+import numpy as np        # Import NumPy to store and memory-map the integer-coded columns
+import pandas as pd        # Import pandas to parse the CSV and rebuild the categorical DataFrame
+
+from facets import FacetEngine
+from instrumentation import count, span
+from filter_index import FILTER_COLUMNS, FilterIndex, encode_column
+from notes_index import NotesIndex
+from records import CatalogTable, ResultSet
+from similarity import SimilarityEngine
+
+CATALOG_PATH = "Perfumes.csv"        # Default catalog shipped with the app
+SNAPSHOT_DIR = ".catalog_cache"        # Folder holding the binary snapshots (one sub-folder per CSV file)
+SNAPSHOT_VERSION = 3        # Bump when the snapshot layout changes so old snapshots are rebuilt
+SIMILAR_K = 3        # Number of similar perfumes precomputed for every item
+PRICE_ORDER = ("Low", "Mid", "High")        # Price levels from cheapest to most expensive
+
+# Sort choices of the result list: label -> (column, descending) or None for catalog order
+SORT_OPTIONS = {
+    "Catalog order": None,
+    "Name (A-Z)": ('name', False),
+    "Price (low to high)": ('price', False),
+    "Price (high to low)": ('price', True),
+}
+
+_catalogs = {}        # Absolute CSV path -> (fingerprint, Catalog) shared by every session of this process
+_lock = threading.Lock()
+
+
+class Catalog:
+    """
+    The perfume catalog together with everything derived from it.
+
+    Built once per catalog load: the DataFrame (categorical columns), the sorted sidebar
+    options, the filter bitmaps, the facet counter and the similarity neighbours (stored in the snapshot after
+    the first load). The notes index and the compact table the results are read from are built on first use.
+    """
+
+    def __init__(self, df):
+        """
+        Args:
+            df (pd.DataFrame): The perfume catalog.
+        """
+        self.df = df
+        presorted = df.attrs.get('sorted_categories', False)        # Set when the frame comes from a snapshot
+        self.options = {        # Sidebar filter key -> sorted distinct values
+            key: sorted_options(df[column], presorted) for key, column in FILTER_COLUMNS.items()
+        }
+        self.filter_index = FilterIndex(df)
+        self.facets = FacetEngine(self.filter_index)
+        self.similarity = SimilarityEngine(df)
+        snapshot = df.attrs.get('snapshot')        # Set when the frame comes from a snapshot
+        if snapshot is None or not load_neighbours(self.similarity, snapshot):
+            self.similarity.precompute(SIMILAR_K)
+            if snapshot is not None:
+                save_neighbours(self.similarity, snapshot)
+        self._notes = None
+        self._lazy_lock = threading.Lock()        # Guards the parts built on first use (notes index, table)
+        self._sort_keys = {}        # (column, descending) -> int64 rank per row, built on first use
+        self._names = None        # Case-folded perfume name -> first row with that name, built on first use
+        self._table = None        # CatalogTable the results point into, built on first use
+
+    @property
+    def notes(self):
+        """NotesIndex over the top/middle/base notes (built on first access)."""
+        if self._notes is None:
+            with self._lazy_lock:
+                if self._notes is None:
+                    self._notes = NotesIndex(self.df)
+        return self._notes
+
+    def find(self, name):
+        """Returns the row position of the first perfume with this name (case-insensitive), or None."""
+        if self._names is None:
+            codes, names = encode_column(self.df['name'])
+            present, first = np.unique(codes, return_index=True)        # First row of every name code
+            lookup = {}
+            for code, row in zip(present.tolist(), first.tolist()):
+                if code >= 0:
+                    lookup.setdefault(" ".join(str(names[code]).casefold().split()), row)
+            self._names = lookup
+        return self._names.get(" ".join(str(name).casefold().split()))
+
+    @property
+    def table(self):
+        """CatalogTable of the catalog: integer-coded columns that records and result sets point into (built on first access)."""
+        if self._table is None:
+            with self._lazy_lock:
+                if self._table is None:
+                    self._table = CatalogTable(self.df)
+        return self._table
+
+    def results(self, rows):
+        """Returns the perfumes at the given row positions as a ResultSet (a view; the rows are not copied)."""
+        return self.table.results(rows)
+
+    def records(self, rows):
+        """Returns the perfumes at the given row positions as plain dictionaries (missing values as None)."""
+        return self.table.to_dicts(np.asarray(rows, dtype=np.int64))
+
+    def sort_key(self, column, descending=False):
+        """
+        Returns an integer rank per row that sorts the catalog by a column.
+
+        Values are ranked alphabetically (price levels by PRICE_ORDER), missing values
+        always come last. Computed once per column and direction.
+        """
+        key = (column, descending)
+        if key not in self._sort_keys:
+            codes, categories = encode_column(self.df[column])
+            if column == 'price':
+                order = sorted(range(len(categories)), key=lambda c: (
+                    PRICE_ORDER.index(categories[c]) if categories[c] in PRICE_ORDER else len(PRICE_ORDER), str(categories[c])))
+            else:
+                order = sorted(range(len(categories)), key=lambda c: str(categories[c]))
+            rank = np.empty(len(categories) + 1, dtype=np.int64)
+            rank[np.asarray(order, dtype=np.int64)] = np.arange(len(categories))
+            if descending:
+                rank[:-1] = len(categories) - 1 - rank[:-1]
+            rank[-1] = len(categories)        # Code -1 (missing) reads the last slot and sorts after every value
+            self._sort_keys[key] = rank[codes]
+        return self._sort_keys[key]
+
+    def page(self, rows, sort=None, page=0, page_size=10):
+        """
+        Returns the row positions of one page of results.
+
+        Only the rows up to the end of the requested page are put in order (a partial
+        selection), so the cost does not depend on sorting every match.
+
+        Args:
+            rows (np.ndarray): Row positions of all matches, in catalog order.
+            sort (tuple): (column, descending), or None to keep catalog order.
+            page (int): Page number, starting at 0.
+            page_size (int): Number of perfumes per page.
+
+        Returns:
+            np.ndarray: Row positions of the perfumes on that page.
+        """
+        start, end = page * page_size, min((page + 1) * page_size, len(rows))
+        if start >= end:
+            return rows[:0]
+        if sort is None:
+            return rows[start:end]
+        keys = self.sort_key(*sort)[rows] * (len(self.df) + 1) + rows        # Ties keep catalog order
+        if end < len(rows):
+            first = np.argpartition(keys, end - 1)[:end]
+        else:
+            first = np.arange(len(rows))
+        first = first[np.argsort(keys[first])]
+        return rows[first[start:end]]
+
+
+def sorted_options(values, presorted=False):
+    """
+    Returns the distinct non-missing values of a column, sorted.
+
+    For a categorical column loaded from a snapshot (presorted=True) the categories are
+    already the sorted distinct values, so nothing has to be scanned.
+    """
+    if presorted and isinstance(values.dtype, pd.CategoricalDtype):
+        return list(values.cat.categories)
+    return sorted(values.dropna().unique())
+
+
+def price_chart_data(results):
+    """
+    Prepares the data of the price comparison chart.
+
+    Args:
+        results (ResultSet or list): The perfumes shown (a ResultSet, or dicts or rows with 'name' and 'price').
+
+    Returns:
+        pd.DataFrame: 'Perfume' and 'Price' columns sorted by price (descending), or None
+        if there are no results.
+    """
+    if not len(results):
+        return None
+    # Read only the two charted fields; building a frame from every field of every perfume costs far more
+    if isinstance(results, ResultSet):
+        names, prices = results.column('name'), results.column('price')
+    else:
+        names, prices = [perfume.get('name') for perfume in results], [perfume.get('price') for perfume in results]
+    df_chart = pd.DataFrame({'Perfume': names, 'Price': prices})
+    df_chart = df_chart.dropna().sort_values(by='Price', ascending=False)
+    return df_chart
+
+
+def code_dtype(categories):
+    """Returns the integer type pandas stores the codes of a categorical with that many categories in."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def file_sha256(path):
+    """Returns the SHA-256 hex digest of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_csv(path):
+    """Parses the catalog CSV (semicolon separated, utf-8)."""
+    return pd.read_csv(path, sep=";", encoding="utf-8")
+
+
+def snapshot_folder(path, snapshot_dir=SNAPSHOT_DIR):
+    """Returns the snapshot folder of a CSV file (next to the CSV unless snapshot_dir is absolute)."""
+    base = os.path.dirname(os.path.abspath(path))
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(base, snapshot_dir, name)
+
+
+def _write_json(path, data):
+    # Write to a temporary file first so readers never see a half-written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def write_snapshot(df, folder, source):
+    """
+    Writes a columnar binary snapshot of the catalog.
+
+    Every column is dictionary-encoded: the sorted distinct values go to a dictionary .json and
+    the codes (-1 for missing) to one .npy file per column, stored in the integer type pandas
+    keeps for that many categories, so the memory-mapped codes are used without a copy. All
+    file names carry the CSV's hash, so a reader never pairs the codes of one version with
+    the dictionary of another. meta.json is written last and is what makes the snapshot valid.
+
+    Args:
+        df (pd.DataFrame): The parsed catalog.
+        folder (str): Snapshot folder.
+        source (dict): Fingerprint of the CSV (mtime_ns, size, sha256).
+    """
+    os.makedirs(folder, exist_ok=True)
+    dictionary = {}
+    codes_files = []
+    for i, column in enumerate(df.columns):
+        column_codes, categories = pd.factorize(df[column], sort=True)
+        dictionary[column] = np.asarray(categories, dtype=object).tolist()
+        codes_file = f"codes-{source['sha256'][:16]}-{i}.npy"
+        tmp = os.path.join(folder, f"{codes_file}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, column_codes.astype(code_dtype(len(categories))))
+        os.replace(tmp, os.path.join(folder, codes_file))
+        codes_files.append(codes_file)
+    dictionary_file = f"dictionary-{source['sha256'][:16]}.json"
+    _write_json(os.path.join(folder, dictionary_file), dictionary)
+    _write_json(os.path.join(folder, "meta.json"), {
+        'version': SNAPSHOT_VERSION,
+        'source': source,
+        'rows': len(df),
+        'columns': list(df.columns),
+        'codes_files': codes_files,
+        'dictionary_file': dictionary_file,
+    })
+    for name in os.listdir(folder):        # Remove the files of older versions of the CSV (a reader still on them rebuilds from the CSV)
+        if (name.startswith(("codes-", "dictionary-", "neighbours-")) and source['sha256'][:16] not in name
+                or name == "dictionary.json"):        # Unversioned dictionary of snapshot version 1
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:        # Already removed by another process
+                pass
+
+
+def read_snapshot(folder, meta):
+    """
+    Rebuilds the catalog DataFrame from a snapshot without parsing any CSV.
+
+    The codes are memory-mapped and already in the integer type pandas uses for them, so
+    the categorical columns keep the mapped arrays: the operating system shares the pages
+    between processes and only reads the parts that are used.
+    """
+    with open(os.path.join(folder, meta['dictionary_file']), encoding="utf-8") as f:
+        dictionary = json.load(f)
+    columns = {}
+    for column, codes_file in zip(meta['columns'], meta['codes_files']):
+        codes = np.load(os.path.join(folder, codes_file), mmap_mode="r")
+        columns[column] = pd.Categorical.from_codes(codes, categories=dictionary[column], validate=False)
+    df = pd.DataFrame(columns, copy=False)
+    df.attrs['sorted_categories'] = True
+    df.attrs['snapshot'] = {'folder': folder, 'sha256': meta['source']['sha256']}
+    return df
+
+
+def _neighbours_file(snapshot):
+    return os.path.join(snapshot['folder'], f"neighbours-{snapshot['sha256'][:16]}-k{SIMILAR_K}.npy")
+
+
+def load_neighbours(engine, snapshot):
+    """
+    Memory-maps the precomputed similar perfumes of a snapshot into a SimilarityEngine.
+
+    The file holds one row per perfume: the SIMILAR_K neighbour positions followed by the
+    'complete' flag. Returns False if the snapshot has no usable neighbour table yet.
+    """
+    try:
+        table = np.load(_neighbours_file(snapshot), mmap_mode="r")
+    except (OSError, ValueError):
+        return False
+    if table.shape != (engine.size, SIMILAR_K + 1):
+        return False
+    engine.use_neighbours(table[:, :SIMILAR_K], table[:, SIMILAR_K].astype(bool))
+    return True
+
+
+def save_neighbours(engine, snapshot):
+    """Stores the precomputed similar perfumes next to the snapshot (see load_neighbours)."""
+    path = _neighbours_file(snapshot)
+    table = np.column_stack([engine.neighbours, engine.complete]).astype(np.int64)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Could not write similarity snapshot: {e}")
+
+
+def _read_meta(folder):
+    try:
+        with open(os.path.join(folder, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != SNAPSHOT_VERSION:
+        return None
+    files = list(meta.get('codes_files', [])) + [meta.get('dictionary_file', "")]
+    if not all(os.path.exists(os.path.join(folder, name)) for name in files):
+        return None
+    return meta
+
+
+def _try_read_snapshot(folder, meta):
+    # A snapshot can vanish or change between reading meta.json and its files (another process replaced it); the caller then parses the CSV
+    try:
+        return read_snapshot(folder, meta)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not read catalog snapshot: {e}")
+        return None
+
+
+def read_catalog_frame(path=CATALOG_PATH, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Loads the catalog DataFrame, from the snapshot when it is still valid.
+
+    The snapshot is reused when the CSV's modification time and size are unchanged, or
+    when they changed but its SHA-256 did not (e.g. after a fresh checkout). Otherwise
+    the CSV is parsed and a new snapshot is written.
+
+    Args:
+        path (str): Path of the catalog CSV.
+        snapshot_dir (str): Snapshot folder name (relative to the CSV) or absolute path.
+
+    Returns:
+        pd.DataFrame: The catalog with categorical columns.
+    """
+    folder = snapshot_folder(path, snapshot_dir)
+    stat = os.stat(path)
+    meta = _read_meta(folder)
+    if meta is not None:
+        source = meta['source']
+        reusable = source['mtime_ns'] == stat.st_mtime_ns and source['size'] == stat.st_size
+        if not reusable and source['size'] == stat.st_size and source['sha256'] == file_sha256(path):
+            meta['source'] = dict(source, mtime_ns=stat.st_mtime_ns)        # Same contents, only the timestamp moved
+            _write_json(os.path.join(folder, "meta.json"), meta)
+            reusable = True
+        if reusable:
+            df = _try_read_snapshot(folder, meta)
+            if df is not None:
+                count("catalog_snapshot_loads")
+                return df
+    source = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': file_sha256(path)}
+    count("catalog_csv_parses")
+    with span("read_csv"):
+        df = read_csv(path)
+    try:
+        write_snapshot(df, folder, source)
+    except OSError as e:        # A read-only deployment still works, it just parses the CSV every cold start
+        print(f"Could not write catalog snapshot: {e}")
+        return df
+    # Serve the memory-mapped version so every load looks the same (unless another process replaced it in the meantime)
+    meta = _read_meta(folder)
+    if meta is None or meta['source']['sha256'] != source['sha256']:
+        return df
+    snapshot = _try_read_snapshot(folder, meta)
+    return df if snapshot is None else snapshot
+
+
+def load_catalog(path=CATALOG_PATH, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Returns the Catalog of a CSV file, loading it at most once per process.
+
+    Every session (and every rerun) gets the same shared Catalog object. A changed CSV
+    (new modification time or size) is picked up on the next call.
+
+    Args:
+        path (str): Path of the catalog CSV.
+        snapshot_dir (str): Snapshot folder name (relative to the CSV) or absolute path.
+
+    Returns:
+        Catalog: The shared catalog.
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    fingerprint = (stat.st_mtime_ns, stat.st_size)
+    cached = _catalogs.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        count("catalog_cache_hits")
+        return cached[1]
+    with _lock:
+        cached = _catalogs.get(key)        # Another session may have loaded it while we waited
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        with span("read_catalog_frame"):
+            df = read_catalog_frame(path, snapshot_dir)
+        with span("build_indexes"):
+            catalog = Catalog(df)
+        _catalogs[key] = (fingerprint, catalog)
+        return catalog
@@ -0,0 +1,50 @@
+# conftest.py to share the small seeded test catalogs between the test files
+#
+# Run the tests:   python -m pytest -q
+
+import pytest        # Import pytest for the shared fixtures
+
+from filter_index import ALL, FILTER_COLUMNS
+from synthetic_catalog import generate_catalog
+
+ROWS = 400        # Small enough for the plain Python loops of the tests, large enough for repeated names, tags and gaps
+
+
+@pytest.fixture(scope="module", params=["plain", "categorical"])
+def df(request):
+    """The same catalog as parsed from the CSV (plain columns) and as loaded from the snapshot (categorical columns)."""
+    frame = generate_catalog(ROWS, seed=11, missing=0.05)
+    return frame.astype("category") if request.param == "categorical" else frame
+
+
+def column_values(df, column):
+    """Returns the values of a column as plain Python objects (None for missing values)."""
+    return [None if value is None or value != value else value for value in df[column].astype(object)]
+
+
+@pytest.fixture
+def values():
+    """column_values(), for the tests that need the catalog as plain Python lists."""
+    return column_values
+
+
+@pytest.fixture
+def filter_values(df):
+    """Filter key -> the values of its catalog column as plain Python objects."""
+    return {key: column_values(df, column) for key, column in FILTER_COLUMNS.items()}
+
+
+def random_filters(df, rng):
+    """Returns a random sidebar selection: mostly catalog values, some "All" and some values the catalog does not have."""
+    filters = {}
+    for key, column in FILTER_COLUMNS.items():
+        present = sorted({value for value in column_values(df, column) if value is not None})
+        roll = rng.random()
+        filters[key] = ALL if roll < 0.25 else "Not In Catalog" if roll < 0.3 else present[rng.integers(len(present))]
+    return filters
+
+
+@pytest.fixture
+def filters_for():
+    """random_filters(), for the tests that query random selections."""
+    return random_filters
@@ -0,0 +1,114 @@
+# facets.py to count, for the current sidebar selection, how many perfumes every remaining option would return
+
+import numpy as np        # Import NumPy for the bitmap intersections and the vectorized counting
+
+from filter_index import ALL
+from instrumentation import count
+
+BLOCK_BYTES = 1 << 23        # Size of the temporary intersections when counting on the bitmaps
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)        # Set bits per byte value
+
+
+def popcount(bits, axis=-1):
+    """Counts the set bits of packed bitmaps along an axis."""
+    if hasattr(np, "bitwise_count"):        # NumPy >= 2.0 counts bits natively
+        return np.bitwise_count(bits).sum(axis=axis, dtype=np.int64)
+    return _POPCOUNT[bits].sum(axis=axis, dtype=np.int64)
+
+
+class FacetEngine:
+    """
+    Live facet counts computed from the bitmaps of a FilterIndex.
+
+    For every filter the counts answer "how many perfumes would I get if I picked this
+    value instead", i.e. they apply all the *other* active filters. Filters without a
+    selection share one combined bitmap, and each selected filter needs one more
+    intersection. Filters with few values are then counted by intersecting all their value
+    bitmaps with it at once and counting bits (1/8 byte per row and value); filters with
+    many values (which have no bitmap per value) use a bincount of their codes over the
+    matching rows instead.
+    """
+
+    def __init__(self, index):
+        """
+        Args:
+            index (FilterIndex): The filter index of the catalog.
+        """
+        self.index = index
+        self.totals = {key: (index.size, self._count(key, None)) for key in index.columns}        # Counts with no filter at all
+
+    def _count(self, key, bits):
+        # Number of rows per value code of one filter, restricted to the rows set in a packed bitmap
+        codes = self.index.codes[key]
+        values = len(self.index.categories[key])
+        matrix = self.index.matrices.get(key)
+        if bits is not None and matrix is not None:
+            rows = max(1, BLOCK_BYTES // max(matrix.shape[1], 1))
+            return np.concatenate([
+                popcount(np.bitwise_and(matrix[lo:lo + rows], bits)) for lo in range(0, len(matrix), rows)
+            ]) if len(matrix) else np.zeros(0, dtype=np.int64)
+        if bits is not None:
+            codes = codes[self.index.mask(bits)]
+        return np.bincount(codes[codes >= 0], minlength=values)        # Missing values (-1) are not counted
+
+    def counts(self, filters):
+        """
+        Computes the facet counts for a (partial) selection.
+
+        Args:
+            filters (dict): Sidebar filter key -> selected value ("All" means no filter).
+
+        Returns:
+            dict: Filter key -> (matching, counts) where matching is the number of perfumes
+            left by the other filters and counts holds one count per value code.
+        """
+        active = [key for key in self.index.columns if filters.get(key, ALL) != ALL]
+        if not active:
+            return dict(self.totals)
+        count("rows_scanned", self.index.size * (len(active) + 1))        # One pass for the matches, one per "all but one"
+        bitmaps = [self.index.bitmap(key, filters[key]) for key in active]
+        # prefix[i] = AND of the first i bitmaps, suffix[i] = AND of bitmaps i..end, so "all but one" is prefix & suffix
+        prefix = [None]
+        for bits in bitmaps:
+            prefix.append(bits if prefix[-1] is None else np.bitwise_and(prefix[-1], bits))
+        suffix = [None]
+        for bits in reversed(bitmaps):
+            suffix.append(bits if suffix[-1] is None else np.bitwise_and(suffix[-1], bits))
+        suffix.reverse()
+
+        matching = prefix[-1]        # Rows matching every active filter
+        matching_count = int(popcount(matching))
+        result = {}
+        for key in self.index.columns:
+            if key not in active:
+                result[key] = (matching_count, self._count(key, matching))
+        for i, key in enumerate(active):
+            before, after = prefix[i], suffix[i + 1]
+            if before is None and after is None:
+                result[key] = self.totals[key]
+                continue
+            others = before if after is None else after if before is None else np.bitwise_and(before, after)
+            result[key] = (int(popcount(others)), self._count(key, others))
+        return result
+
+    def options(self, filters, values):
+        """
+        Pairs every option of the sidebar with its facet count.
+
+        Args:
+            filters (dict): Sidebar filter key -> selected value ("All" means no filter).
+            values (dict): Filter key -> list of option values in display order (catalog.options).
+
+        Returns:
+            dict: Filter key -> {"All": perfumes left by the other filters, value: count, ...},
+            in the order of `values`.
+        """
+        counts = self.counts(filters)
+        result = {}
+        for key in values:
+            matching, per_code = counts[key]
+            lookup = self.index.lookup[key]
+            result[key] = {ALL: matching}
+            result[key].update((value, int(per_code[lookup[value]]) if value in lookup else 0) for value in values[key])
+        return result
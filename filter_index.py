@@ -0,0 +1,187 @@
+# filter_index.py to answer the sidebar filters of the perfume finder without looping over every row
+
+import numpy as np        # Import NumPy for the packed bitmaps and the fast bitwise intersections
+import pandas as pd        # Import pandas to dictionary-encode the catalog columns
+
+from instrumentation import count
+
+# Maps each sidebar filter key to the catalog column it is matched against
+# ('scent' is the sidebar name for the 'scent_direction' column)
+FILTER_COLUMNS = {
+    'brand': 'brand',
+    'gender': 'gender',
+    'scent': 'scent_direction',
+    'season': 'season',
+    'personality': 'personality',
+    'occasion': 'occasion',
+    'price': 'price',
+}
+
+ALL = "All"        # Sidebar value meaning "do not filter on this attribute"
+BITMAP_VALUES = 16        # Filters with at most this many values get one bitmap per value; larger ones (the brand) keep row lists
+
+
+def column_codes(values, dtype=None):
+    """
+    Dictionary-encodes a catalog column without copying what is already encoded.
+
+    Args:
+        values (pd.Series): The column to encode.
+        dtype: Integer type of the codes; None keeps the smallest type that fits (for a
+            categorical column, its own codes, memory-mapped when loaded from the snapshot).
+
+    Returns:
+        tuple: (codes, categories) where codes is an integer array (-1 for missing values)
+        and categories is the pd.Index of distinct values in code order (for a categorical
+        column, the one its dtype holds).
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):        # Categorical columns are already encoded, so reuse their codes as they are
+        codes, categories = values.array.codes, values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)        # Missing values get the code -1, exactly like categoricals
+        categories = pd.Index(uniques)
+        if dtype is None:
+            dtype = np.min_scalar_type(-max(len(categories), 1))
+    return np.asarray(codes, dtype=dtype), categories        # A plain array view (no copy when the type already matches)
+
+
+def encode_column(values):
+    """
+    Dictionary-encodes a catalog column into integer codes.
+
+    Args:
+        values (pd.Series): The column to encode.
+
+    Returns:
+        tuple: (codes, categories) where codes is an int32 array (-1 for missing values)
+        and categories is the list of distinct values in code order.
+    """
+    codes, categories = column_codes(values, np.int32)
+    return codes, list(categories)
+
+
+class FilterIndex:
+    """
+    Precomputed index with one packed bitmap per (filter, value) pair.
+
+    The index is built once per catalog load. A query intersects the bitmaps of the
+    selected values with a bitwise AND, so its cost depends on the catalog size divided
+    by eight (one bit per perfume) instead of on a Python loop over every row.
+
+    A bitmap per value costs one bit per perfume, which adds up for a filter with
+    thousands of values. Filters with more than BITMAP_VALUES values (the brand) keep
+    the sorted row list of every value instead; a query selecting one of them starts
+    from that list and only checks the other filters on its rows.
+    """
+
+    def __init__(self, df, columns=FILTER_COLUMNS):
+        """
+        Args:
+            df (pd.DataFrame): The perfume catalog.
+            columns (dict): Sidebar filter key -> catalog column name.
+        """
+        self.size = len(df)        # Number of perfumes in the catalog
+        self.columns = dict(columns)
+        self.codes = {}        # filter key -> integer code per row (the categorical's own codes when it has them)
+        self.categories = {}        # filter key -> list of distinct values (position = code)
+        self.lookup = {}        # filter key -> {value: code}
+        self.matrices = {}        # filter key -> packed bitmaps of all its values stacked as rows (row = code); small filters only
+        self.bitmaps = {}        # (filter key, value) -> packed bitmap of the matching rows (a row of the matrix above)
+        self.postings = {}        # filter key -> (rows sorted by code, start of every code in them); large filters only
+        for key, column in self.columns.items():
+            codes, categories = column_codes(df[column])
+            categories = list(categories)
+            self.codes[key] = codes
+            self.categories[key] = categories
+            self.lookup[key] = {value: code for code, value in enumerate(categories)}
+            # Sorting the rows by code groups every value together, so each value is one slice (rows stay in catalog order)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+            if len(categories) > BITMAP_VALUES:
+                self.postings[key] = (order, bounds)
+                continue
+            matrix = np.empty((len(categories), (self.size + 7) // 8), dtype=np.uint8)
+            mask = np.empty(self.size, dtype=bool)
+            for code, value in enumerate(categories):
+                mask[:] = False
+                mask[order[bounds[code]:bounds[code + 1]]] = True
+                matrix[code] = np.packbits(mask)
+                self.bitmaps[(key, value)] = matrix[code]
+            self.matrices[key] = matrix
+        self._everything = np.packbits(np.ones(self.size, dtype=bool))        # Bitmap used when every filter is "All"
+        self._nothing = np.zeros_like(self._everything)        # Bitmap used when a selected value is not in the catalog
+
+    def rows(self, key, value):
+        """Returns the row positions (in catalog order) with one filter value (empty if the value never occurs)."""
+        code = self.lookup[key].get(value)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        if key in self.postings:
+            order, bounds = self.postings[key]
+            return order[bounds[code]:bounds[code + 1]]
+        return np.flatnonzero(self.mask(self.matrices[key][code]))
+
+    def bitmap(self, key, value):
+        """Returns the packed bitmap for one filter value (empty if the value never occurs)."""
+        bits = self.bitmaps.get((key, value))
+        if bits is not None:
+            return bits
+        if key not in self.postings or value not in self.lookup[key]:
+            return self._nothing
+        mask = np.zeros(self.size, dtype=bool)        # Filters with many values have no stored bitmaps; build it from the row list
+        mask[self.rows(key, value)] = True
+        return np.packbits(mask)
+
+    def match_bitmap(self, filters, exclude=None):
+        """
+        Intersects the bitmaps of every active filter.
+
+        Args:
+            filters (dict): Sidebar filter key -> selected value ("All" means no filter).
+            exclude (str): Optional filter key to leave out of the intersection.
+
+        Returns:
+            np.ndarray: Packed bitmap of the matching rows.
+        """
+        selected = [
+            self.bitmap(key, value)
+            for key, value in filters.items()
+            if key in self.columns and key != exclude and value != ALL
+        ]
+        if not selected:
+            return self._everything
+        if len(selected) == 1:
+            return selected[0]
+        result = np.bitwise_and(selected[0], selected[1])        # First AND allocates the result, the rest work in place
+        for bits in selected[2:]:
+            np.bitwise_and(result, bits, out=result)
+        return result
+
+    def mask(self, bits):
+        """Unpacks a bitmap into a boolean mask with one entry per catalog row."""
+        return np.unpackbits(bits, count=self.size).view(bool)
+
+    def query(self, filters):
+        """
+        Finds the catalog rows that match every active filter.
+
+        Args:
+            filters (dict): Sidebar filter key -> selected value ("All" means no filter).
+
+        Returns:
+            np.ndarray: Row positions of the matching perfumes, in catalog order.
+        """
+        active = {key: value for key, value in filters.items() if key in self.columns and value != ALL}
+        listed = [key for key in active if key in self.postings]
+        if not listed:
+            count("rows_scanned", self.size)
+            return np.flatnonzero(self.mask(self.match_bitmap(active)))
+        # A value of a large filter matches few rows: start from its row list and check every filter on those rows only
+        rows = min((self.rows(key, active[key]) for key in listed), key=len)
+        count("rows_scanned", len(rows))
+        for key, value in active.items():
+            code = self.lookup[key].get(value)
+            if code is None:        # A value that never occurs matches nothing
+                return np.empty(0, dtype=np.int64)
+            rows = rows[self.codes[key][rows] == code]
+        return rows
@@ -0,0 +1,276 @@
+# instrumentation.py to see where the time of a rerun (or an API request) goes: stage timings, work counters and profiles
+#
+# Switched on with ?debug=1 in the app URL or PERFUME_DEBUG=1 in the environment. When no recording
+# is running, span() and count() only look up one context variable, so the hooks can stay in the code.
+#
+#   with recording("rerun") as rec:        # Everything below is recorded into `rec`
+#       with span("filter_perfumes"):
+#           ...
+#       count("rows_scanned", 135)
+
+import contextlib        # Import contextlib to offer the recording as a context manager
+import contextvars        # Import contextvars so every session (and every thread it starts) records into its own recording
+import cProfile        # Import cProfile for the optional function-level profile
+import functools        # Import functools to wrap timed functions
+import io        # Import io to capture the profile report as text
+import json        # Import json for the JSON-lines export
+import os        # Import os to read the switches from the environment
+import pstats        # Import pstats to format the profile
+import threading        # Import threading to guard the shared totals
+import time        # Import time for the timings
+from collections import deque        # Import deque to keep the last recordings
+
+ENV_FLAG = "PERFUME_DEBUG"        # PERFUME_DEBUG=1 switches the instrumentation on for every session
+METRICS_FILE = os.environ.get("PERFUME_METRICS_FILE")        # If set, every finished recording is appended to it as one JSON line
+HISTORY = 50        # Finished recordings kept in memory for the JSON-lines export
+PROFILE_LINES = 30        # Functions listed in a profile report
+
+_current = contextvars.ContextVar("perfume_recording", default=None)        # Recording of the running rerun/request
+_stack = contextvars.ContextVar("perfume_span", default=())        # Names of the enclosing spans
+_lock = threading.Lock()
+_span_totals = {}        # Span name -> [count, seconds, max seconds] over every finished recording
+_counter_totals = {}        # Counter name -> total over every finished recording
+_history = deque(maxlen=HISTORY)
+_finished = [0]        # Number of finished recordings
+
+
+def debug_enabled(flag=None):
+    """Returns True if the instrumentation is switched on (by PERFUME_DEBUG=1 or a '1'/'true' flag such as ?debug=1)."""
+    values = (os.environ.get(ENV_FLAG, ""), flag or "")
+    return any(str(value).strip().lower() in ("1", "true", "yes", "on") for value in values)
+
+
+class Recording:
+    """The spans, counters and (optional) profile of one rerun or request."""
+
+    def __init__(self, name, profile=False):
+        """
+        Args:
+            name (str): What is being recorded (e.g. "rerun" or "GET /filter").
+            profile (bool): Also run cProfile in the recording thread.
+        """
+        self.name = name
+        self.started_at = time.time()
+        self.seconds = None        # Total duration, set when the recording is finished
+        self.spans = []        # One dict per finished span: name, path, depth, start_ms, ms, thread
+        self.counters = {}
+        self.profile = None        # Text report of the profile, set when the recording is finished
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._token = None
+        self._profiler = None
+        if profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self._profiler = profiler
+            except ValueError:        # Another session is profiling right now; only one profiler may run at a time
+                self.profile = "(not profiled: another profile was running)"
+
+    def add_span(self, path, start, end):
+        with self._lock:
+            self.spans.append({
+                'name': path[-1],
+                'path': " > ".join(path),
+                'depth': len(path) - 1,
+                'start_ms': round((start - self._start) * 1000, 3),
+                'ms': round((end - start) * 1000, 3),
+                'thread': threading.current_thread().name,
+            })
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self):
+        """Returns the recording as a JSON-serializable dict (one line of the JSON-lines export)."""
+        return {
+            'name': self.name,
+            'started_at': round(self.started_at, 3),
+            'ms': round(self.seconds * 1000, 3) if self.seconds is not None else None,
+            'spans': sorted(self.spans, key=lambda s: s['start_ms']),
+            'counters': dict(self.counters),
+        }
+
+
+class _Span:
+    # Times one stage into a recording; nested spans know their parents through the _stack context variable
+    __slots__ = ('recording', 'name', 'path', 'start', 'token')
+
+    def __init__(self, recording, name):
+        self.recording = recording
+        self.name = name
+
+    def __enter__(self):
+        self.path = _stack.get() + (self.name,)
+        self.token = _stack.set(self.path)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _stack.reset(self.token)
+        self.recording.add_span(self.path, self.start, end)
+        return False
+
+
+class _NoSpan:
+    # Returned by span() when nothing is recorded
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    """Context manager timing a stage of the running recording (does nothing when none is running)."""
+    active = _current.get()
+    if active is None:
+        return _NO_SPAN
+    return _Span(active, name)
+
+
+def timed(name):
+    """Decorator timing every call of a function as a span."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            active = _current.get()
+            if active is None:
+                return function(*args, **kwargs)
+            with _Span(active, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, amount=1):
+    """Adds to a counter of the running recording (does nothing when none is running)."""
+    active = _current.get()
+    if active is not None:
+        active.count(name, amount)
+
+
+def current():
+    """Returns the running Recording, or None."""
+    return _current.get()
+
+
+def in_context(function):
+    """
+    Binds a function to a copy of the caller's context, for running it in another thread.
+
+    Spans and counters of work handed to a thread pool then land in the caller's
+    recording, nested under the caller's current span.
+    """
+    return functools.partial(contextvars.copy_context().run, function)
+
+
+def start_recording(name="rerun", profile=False):
+    """Starts recording the current context (see finish_recording); returns the Recording."""
+    recorded = Recording(name, profile)
+    recorded._token = _current.set(recorded)
+    return recorded
+
+
+def finish_recording(recorded):
+    """
+    Stops a recording started with start_recording, adds it to the process totals and
+    returns it.
+    """
+    recorded.seconds = time.perf_counter() - recorded._start
+    if recorded._profiler is not None:
+        recorded._profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(recorded._profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        recorded.profile = report.getvalue()
+        recorded._profiler = None
+    if recorded._token is not None:
+        try:
+            _current.reset(recorded._token)
+        except ValueError:        # Finished from another context; just stop recording there
+            _current.set(None)
+        recorded._token = None
+    with _lock:
+        _finished[0] += 1
+        for item in recorded.spans:
+            totals = _span_totals.setdefault(item['name'], [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += item['ms'] / 1000
+            totals[2] = max(totals[2], item['ms'] / 1000)
+        for name, amount in recorded.counters.items():
+            _counter_totals[name] = _counter_totals.get(name, 0) + amount
+        _history.append(recorded)
+    if METRICS_FILE:
+        try:
+            with open(METRICS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(recorded.to_dict()) + "\n")
+        except OSError as e:
+            print(f"Could not write metrics: {e}")
+    return recorded
+
+
+@contextlib.contextmanager
+def recording(name="rerun", profile=False):
+    """Context manager recording everything that runs inside it (see start_recording)."""
+    recorded = start_recording(name, profile)
+    try:
+        yield recorded
+    finally:
+        finish_recording(recorded)
+
+
+def history():
+    """Returns the last finished recordings of this process, oldest first."""
+    with _lock:
+        return list(_history)
+
+
+def to_json_lines(recordings=None):
+    """Returns recordings (default: the history) as JSON lines, one recording per line."""
+    return "".join(json.dumps(r.to_dict()) + "\n" for r in (history() if recordings is None else recordings))
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    """Returns the totals of this process in the Prometheus text exposition format."""
+    with _lock:
+        spans = {name: list(totals) for name, totals in _span_totals.items()}
+        counters = dict(_counter_totals)
+        finished = _finished[0]
+    lines = [
+        "# HELP perfume_recordings_total Finished recordings (reruns or API requests).",
+        "# TYPE perfume_recordings_total counter",
+        f"perfume_recordings_total {finished}",
+        "# HELP perfume_span_seconds Time spent in each instrumented stage.",
+        "# TYPE perfume_span_seconds summary",
+    ]
+    for name in sorted(spans):
+        lines.append(f'perfume_span_seconds_count{{span="{_label(name)}"}} {spans[name][0]}')
+        lines.append(f'perfume_span_seconds_sum{{span="{_label(name)}"}} {spans[name][1]:.6f}')
+    lines += ["# HELP perfume_span_seconds_max Slowest run of each instrumented stage.", "# TYPE perfume_span_seconds_max gauge"]
+    for name in sorted(spans):
+        lines.append(f'perfume_span_seconds_max{{span="{_label(name)}"}} {spans[name][2]:.6f}')
+    lines += ["# HELP perfume_events_total Work counted during the recordings (rows scanned, API calls, cache hits).",
+              "# TYPE perfume_events_total counter"]
+    for name in sorted(counters):
+        lines.append(f'perfume_events_total{{event="{_label(name)}"}} {counters[name]}')
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Forgets the history and the totals of this process."""
+    with _lock:
+        _span_totals.clear()
+        _counter_totals.clear()
+        _history.clear()
+        _finished[0] = 0
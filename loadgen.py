@@ -0,0 +1,127 @@
+# loadgen.py sends concurrent requests to a running api_server.py and reports throughput (QPS) and latency percentiles
+#
+# Run it:   python api_server.py --port 8000 &
+#           python loadgen.py --url http://127.0.0.1:8000 --duration 10 --concurrency 32 --scenario mix
+
+import argparse        # Import argparse to read the command-line options
+import http.client        # Import http.client for persistent (keep-alive) connections with little overhead
+import json        # Import json to build the request bodies
+import random        # Import random to pick the queries
+import threading        # Import threading to run the concurrent clients
+import time        # Import time to measure the latencies
+from urllib.parse import quote, urlencode, urlparse        # Import helpers to build the request URLs
+
+from places_stub_server import percentile
+
+SCENARIOS = ("filter", "similar", "batch", "mix")
+
+
+def build_requests(options, names, scenario, rng):
+    """Returns a function producing the next (method, path, body) request of a scenario."""
+    keys = list(options)
+
+    def random_filters():
+        # One to three random filters, like a user narrowing down the sidebar
+        return {key: rng.choice(options[key]) for key in rng.sample(keys, rng.randint(1, 3)) if options[key]}
+
+    def filter_request():
+        return "GET", "/filter?" + urlencode(dict(random_filters(), page_size=20)), None
+
+    def similar_request():
+        return "GET", "/similar/" + quote(rng.choice(names)) + "?k=3", None
+
+    def batch_request():
+        body = {'queries': [{'filters': random_filters(), 'page_size': 10} for _ in range(10)]}
+        return "POST", "/filter", json.dumps(body).encode("utf-8")        # bytes go out in the same packet as the headers
+
+    if scenario == "filter":
+        return filter_request
+    if scenario == "similar":
+        return similar_request
+    if scenario == "batch":
+        return batch_request
+    return lambda: rng.choice((filter_request, filter_request, similar_request, batch_request))()
+
+
+def run(url, duration, concurrency, scenario, seed=0):
+    """
+    Runs the load test and returns its measurements.
+
+    Every client thread keeps one connection open and sends its next request as soon as
+    the previous answer arrived (closed loop), for `duration` seconds.
+
+    Returns:
+        dict: requests, errors, qps and latency percentiles in milliseconds.
+    """
+    target = urlparse(url)
+    setup = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+    setup.request("GET", "/options")
+    options = json.loads(setup.getresponse().read())
+    setup.request("GET", "/filter?page_size=100")
+    names = [perfume['name'] for perfume in json.loads(setup.getresponse().read())['results']]
+    setup.close()
+
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(number):
+        rng = random.Random(seed + number)
+        next_request = build_requests(options, names, scenario, rng)
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        own, failed = [], 0
+        while time.perf_counter() < stop_at:
+            method, path, body = next_request()
+            start = time.perf_counter()
+            try:
+                headers = {'Content-Type': "application/json"} if body else {}
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    failed += 1
+                else:
+                    own.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        connection.close()
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    result = {'scenario': scenario, 'concurrency': concurrency, 'requests': len(latencies), 'errors': errors[0],
+              'seconds': round(elapsed, 2), 'qps': round(len(latencies) / elapsed, 1)}
+    if latencies:
+        result.update({f"p{q}_ms": round(percentile(latencies, q) * 1000, 2) for q in (50, 90, 99)})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for api_server.py.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mix")
+    parser.add_argument("--json", action="store_true", help="print the result as one JSON line")
+    args = parser.parse_args()
+    result = run(args.url, args.duration, args.concurrency, args.scenario)
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(f"{result['scenario']}: {result['requests']} requests in {result['seconds']}s with {result['concurrency']} clients"
+          f" -> {result['qps']} QPS, {result['errors']} errors")
+    if result['requests']:
+        print(f"latency p50 {result['p50_ms']} ms | p90 {result['p90_ms']} ms | p99 {result['p99_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
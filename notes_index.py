@@ -0,0 +1,208 @@
+# notes_index.py to search and compare perfumes by their top, middle and base notes
+
+import numpy as np        # Import NumPy for the sparse item x note matrix and the vectorized scoring
+import pandas as pd        # Import pandas to split the comma-separated note strings in one pass
+
+# Note columns of the catalog and how much a note counts depending on its tier
+# (base notes last the longest on the skin, top notes fade first)
+TIER_WEIGHTS = {
+    'top_notes': 0.75,
+    'middle_notes': 1.0,
+    'base_notes': 1.25,
+}
+
+
+def normalize_note(note):
+    """Returns the canonical spelling of a note ('  Tonka Bean ' -> 'tonka bean')."""
+    return " ".join(str(note).lower().split())
+
+
+class NotesIndex:
+    """
+    Sparse item x note matrix built once from the note columns of the catalog.
+
+    The note strings are split a single time into a vocabulary. The weights are stored
+    twice in compressed form: by item (CSR, for reading one perfume's profile) and by note
+    (CSC, i.e. an inverted index of posting lists). Queries then only touch the posting
+    lists of the requested notes.
+    """
+
+    def __init__(self, df, tier_weights=TIER_WEIGHTS, tfidf=False):
+        """
+        Args:
+            df (pd.DataFrame): The perfume catalog.
+            tier_weights (dict): Note column -> weight of a note found in that tier.
+            tfidf (bool): If True, scale each note by its inverse document frequency
+                so that rare notes count more than ubiquitous ones.
+        """
+        self.size = len(df)
+        self.tfidf = tfidf
+        # Split every distinct note string once; catalog rows then only refer to it by code
+        parsed = {}        # Note column -> (cell code per row, list of parsed notes per distinct cell)
+        vocabulary = set()
+        for column in tier_weights:
+            cell_codes, cells = pd.factorize(df[column])
+            notes = [[normalize_note(n) for n in str(cell).split(",") if n.strip()] for cell in cells]
+            parsed[column] = (cell_codes, notes)
+            vocabulary.update(n for cell in notes for n in cell)
+        self.vocabulary = sorted(vocabulary)        # Note code -> note name (alphabetical)
+        self.lookup = {note: code for code, note in enumerate(self.vocabulary)}
+        n_notes = len(self.vocabulary)
+
+        rows, note_codes, weights = [], [], []
+        for column, weight in tier_weights.items():
+            cell_codes, notes = parsed[column]
+            lengths = np.array([len(cell) for cell in notes] + [0], dtype=np.int64)        # Missing cells (code -1) have no notes
+            flat = np.array([self.lookup[n] for cell in notes for n in cell], dtype=np.int64)
+            cell_start = np.concatenate(([0], np.cumsum(lengths[:-1])))
+            per_row = lengths[cell_codes]
+            total = int(per_row.sum())
+            row_start = np.repeat(np.cumsum(per_row) - per_row, per_row)
+            rows.append(np.repeat(np.arange(self.size, dtype=np.int64), per_row))
+            note_codes.append(flat[np.repeat(cell_start[cell_codes], per_row) + np.arange(total) - row_start])
+            weights.append(np.full(total, weight, dtype=np.float64))
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        note_codes = np.concatenate(note_codes) if note_codes else np.empty(0, dtype=np.int64)
+        weights = np.concatenate(weights) if weights else np.empty(0, dtype=np.float64)
+
+        # Merge a note listed in several tiers of the same perfume into one weighted entry
+        cell = rows * max(n_notes, 1) + note_codes
+        cell, inverse = np.unique(cell, return_inverse=True)
+        values = np.bincount(inverse.ravel(), weights=weights, minlength=len(cell))
+        item_of = cell // max(n_notes, 1)
+        note_of = cell % max(n_notes, 1)
+
+        self.document_frequency = np.bincount(note_of, minlength=n_notes)        # Number of perfumes containing each note
+        self.idf = np.log((1 + self.size) / (1 + self.document_frequency)) + 1.0
+        if tfidf:
+            values = values * self.idf[note_of]
+        norms = np.sqrt(np.bincount(item_of, weights=values ** 2, minlength=self.size))
+        values = values / np.where(norms > 0, norms, 1.0)[item_of]        # Unit-length profiles turn a dot product into a cosine
+
+        # CSR: entries grouped by perfume (np.unique already sorted them by perfume, then note)
+        self.item_ptr = np.searchsorted(item_of, np.arange(self.size + 1))
+        self.item_notes = note_of.astype(np.int32)
+        self.item_values = values
+        # CSC: the same entries grouped by note (posting lists of perfumes, in catalog order)
+        order = np.argsort(note_of, kind='stable')
+        self.note_ptr = np.searchsorted(note_of[order], np.arange(n_notes + 1))
+        self.note_items = item_of[order]
+        self.note_values = values[order]
+
+    def _codes(self, notes):
+        # Codes of the known notes (unknown notes are returned as -1)
+        return [self.lookup.get(normalize_note(note), -1) for note in notes]
+
+    def postings(self, code):
+        """Returns the catalog rows containing the note with the given code."""
+        return self.note_items[self.note_ptr[code]:self.note_ptr[code + 1]]
+
+    def notes_of(self, row):
+        """Returns the (note, weight) profile of the perfume at a row position."""
+        lo, hi = self.item_ptr[row], self.item_ptr[row + 1]
+        return [(self.vocabulary[c], float(v)) for c, v in zip(self.item_notes[lo:hi], self.item_values[lo:hi])]
+
+    def containing(self, notes, match="all"):
+        """
+        Finds the perfumes containing the given notes (in any tier).
+
+        Args:
+            notes (list): Note names, e.g. ["vanilla", "rose"].
+            match (str): "all" to require every note, "any" to accept at least one.
+
+        Returns:
+            np.ndarray: Row positions of the matching perfumes, in catalog order.
+        """
+        if match not in ("all", "any"):
+            raise ValueError(f"match must be 'all' or 'any', not {match!r}")
+        codes = self._codes(notes)
+        if match == "all":
+            if not codes or min(codes) < 0:        # An unknown note cannot be matched by any perfume
+                return np.empty(0, dtype=np.int64)
+            lists = sorted((self.postings(c) for c in set(codes)), key=len)        # Start from the shortest list
+            result = lists[0]
+            for other in lists[1:]:
+                if len(result) == 0:
+                    break
+                if len(other) * 16 > self.size:        # Common note: mark its perfumes and test membership directly
+                    member = np.zeros(self.size, dtype=bool)
+                    member[other] = True
+                    result = result[member[result]]
+                else:        # Rare note: posting lists are sorted, so a binary search finds the shared perfumes
+                    found = np.minimum(np.searchsorted(other, result), len(other) - 1)
+                    result = result[other[found] == result]
+            return result
+        lists = [self.postings(c) for c in set(codes) if c >= 0]
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate(lists)
+        if len(rows) * 16 > self.size:        # Common notes: marking a catalog-sized mask is cheaper than sorting
+            hit = np.zeros(self.size, dtype=bool)
+            hit[rows] = True
+            return np.flatnonzero(hit)
+        rows.sort()        # Rare notes: merge the posting lists without touching the rest of the catalog
+        return rows[np.diff(rows, prepend=-1) != 0]
+
+    def query_vector(self, notes):
+        """Builds a unit-length (note codes, weights) query from a list of note names."""
+        codes = np.array(sorted({c for c in self._codes(notes) if c >= 0}), dtype=np.int64)
+        weights = self.idf[codes] if self.tfidf else np.ones(len(codes))
+        norm = np.sqrt((weights ** 2).sum())
+        return codes, weights / norm if norm > 0 else weights
+
+    def similar(self, query, k=5):
+        """
+        Finds the perfumes with the most similar note profile (cosine similarity).
+
+        Args:
+            query (int or list): A catalog row position, or a list of note names.
+            k (int): Number of perfumes to return.
+
+        Returns:
+            list: (row position, similarity) pairs, most similar first. Perfumes without
+            any note in common are left out, and a row query never returns itself.
+
+        The scores are exact, so the posting lists of every query note are read. A perfume
+        usually has a few common notes whose lists cover a large part of the catalog, which
+        makes a row query linear in the catalog size: about 0.6 ms at 100k perfumes and 9 ms
+        at 1M on the synthetic catalog (see the notes_similar hot path of benchmark.py).
+        """
+        if isinstance(query, (int, np.integer)):
+            lo, hi = self.item_ptr[query], self.item_ptr[query + 1]
+            codes, weights, itself = self.item_notes[lo:hi], self.item_values[lo:hi], int(query)
+        else:
+            (codes, weights), itself = self.query_vector(query), None
+        if len(codes) == 0 or k <= 0:
+            return []
+        # Sparse dot product: only the posting lists of the query notes are read
+        starts, ends = self.note_ptr[codes], self.note_ptr[np.asarray(codes) + 1]
+        touched = np.concatenate([self.note_items[s:e] for s, e in zip(starts, ends)])
+        contrib = np.concatenate([self.note_values[s:e] * w for s, e, w in zip(starts, ends, weights)])
+        if len(touched) * 16 > self.size:        # Common notes: one catalog-sized sum is cheaper than sorting
+            scores = np.bincount(touched, weights=contrib, minlength=self.size)
+            if itself is not None:
+                scores[itself] = 0.0
+            # The perfumes of the rarest query note bound the k-th best score from below; keeping only the perfumes
+            # at least that good is one comparison, instead of collecting and partitioning every touched perfume
+            rarest = np.argmin(ends - starts)
+            seen = scores[self.note_items[starts[rarest]:ends[rarest]]]
+            floor = np.partition(seen, len(seen) - k)[len(seen) - k] - 1e-9 if len(seen) >= k else 0.0
+            candidates = np.flatnonzero(scores > max(floor, 0.0))
+            scores = scores[candidates]
+        else:        # Rare notes: sum per touched perfume only, so the cost does not grow with the catalog
+            order = np.argsort(touched, kind='stable')
+            new_row = np.diff(touched[order], prepend=-1) != 0
+            candidates = touched[order][new_row]
+            inverse = np.empty(len(touched), dtype=np.int64)        # Position of every entry's perfume in candidates
+            inverse[order] = np.cumsum(new_row) - 1
+            scores = np.bincount(inverse, weights=contrib, minlength=len(candidates))
+            keep = (scores > 0) & (candidates != (-1 if itself is None else itself))
+            candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > k:
+            # Keep every candidate at least as good as the k-th best (with a little slack for rounding noise)
+            threshold = np.partition(scores, len(candidates) - k)[len(candidates) - k]
+            keep = scores >= threshold - 1e-9
+            candidates, scores = candidates[keep], scores[keep]
+        rounded = np.round(scores, 9)        # Equal profiles must tie exactly so catalog order decides
+        order = np.lexsort((candidates, -rounded))[:k]
+        return [(int(r), float(s)) for r, s in zip(candidates[order], scores[order])]
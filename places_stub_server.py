@@ -0,0 +1,162 @@
+# places_stub_server.py is a local stand-in for the Google Places Text Search API, to measure the shop finder offline
+#
+# Serve it:        python places_stub_server.py --port 8765 --latency-ms 120 --error-rate 0.05
+# Point the app:   PLACES_API_URL=http://127.0.0.1:8765/maps/api/place/textsearch/json streamlit run streamlit_app.py
+# Measure:         python places_stub_server.py --bench 500 --workers 16
+
+import argparse        # Import argparse to read the command-line options
+import hashlib        # Import hashlib to derive stable fake shops from the query
+import json        # Import json to encode the responses
+import random        # Import random for the simulated latency and errors
+import statistics        # Import statistics for the latency percentiles
+import threading        # Import threading to run the server next to the benchmark
+import time        # Import time to simulate latency and measure it
+from concurrent.futures import ThreadPoolExecutor        # Import a thread pool to send the benchmark lookups
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer        # Import the standard-library HTTP server
+from urllib.parse import parse_qs, urlparse        # Import helpers to read the query string
+
+SEARCH_PATH = "/maps/api/place/textsearch/json"
+
+
+class PlacesStubHandler(BaseHTTPRequestHandler):
+    """Answers Text Search requests with deterministic fake shops after a simulated delay."""
+
+    protocol_version = "HTTP/1.1"        # Keep connections alive like the real API, so pooling can be measured
+    latency_ms = 100.0        # Median simulated latency
+    latency_sigma = 0.5        # Spread of the log-normal latency (larger = heavier tail)
+    error_rate = 0.0        # Share of requests answered with 503
+    rate_limit = 0.0        # Share of requests answered with 429
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != SEARCH_PATH:
+            self._send(404, {'status': 'NOT_FOUND'})
+            return
+        query = parse_qs(url.query).get('query', [""])[0]
+        time.sleep(random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000)
+        draw = random.random()
+        if draw < self.rate_limit:
+            self._send(429, {'status': 'OVER_QUERY_LIMIT'}, {'Retry-After': "0.1"})
+        elif draw < self.rate_limit + self.error_rate:
+            self._send(503, {'status': 'UNKNOWN_ERROR'})
+        else:
+            self._send(200, {'status': 'OK', 'results': fake_places(query)})
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):        # The client gave up (timeout) before the answer was ready
+            self.close_connection = True
+
+    def log_message(self, format, *args):        # Keep the console quiet during benchmarks
+        pass
+
+
+def fake_places(query, count=5):
+    """Returns the same made-up shops every time for the same query."""
+    seed = int(hashlib.sha1(query.encode("utf-8")).hexdigest()[:8], 16)
+    return [
+        {'name': f"Parfumerie {(seed >> i) % 97:02d}", 'formatted_address': f"Bahnhofstrasse {(seed + i) % 120 + 1}, Zurich"}
+        for i in range(count)
+    ]
+
+
+def start_server(port=0, latency_ms=100.0, latency_sigma=0.5, error_rate=0.0, rate_limit=0.0):
+    """
+    Starts the stub server in a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server (call shutdown() to stop it).
+    """
+    handler = type("ConfiguredPlacesStubHandler", (PlacesStubHandler,), {
+        'latency_ms': latency_ms,
+        'latency_sigma': latency_sigma,
+        'error_rate': error_rate,
+        'rate_limit': rate_limit,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, q):
+    """Returns the q-th percentile (0-100) of a list of numbers."""
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[min(max(int(q), 1), 99) - 1]
+
+
+def bench(server, lookups, workers):
+    """Measures throughput and latency of the shop finder against a running stub server."""
+    import shop_finder_api        # Imported here so PLACES_API_URL can be pointed at the stub first
+
+    shop_finder_api.PLACES_URL = f"http://127.0.0.1:{server.server_address[1]}{SEARCH_PATH}"
+    shop_finder_api.MAX_WORKERS = workers
+    shop_finder_api._session = None        # Rebuild the pool with the requested size
+    names = [f"Perfume {i}" for i in range(lookups)]
+
+    latencies, failures = [], 0
+
+    def timed(name):
+        start = time.perf_counter()
+        try:
+            shop_finder_api.fetch_shops(name)
+            return time.perf_counter() - start
+        except shop_finder_api.ShopLookupError:
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for latency in pool.map(timed, names):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - start
+    print(f"single lookups: {lookups} in {elapsed:.2f}s -> {lookups / elapsed:.1f} lookups/s, {failures} failed")
+    if latencies:
+        print(f"latency p50 {percentile(latencies, 50) * 1000:.0f} ms | p95 {percentile(latencies, 95) * 1000:.0f} ms"
+              f" | p99 {percentile(latencies, 99) * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    # Without the shop cache: the shared one lives on disk, so later runs would only measure cache hits
+    results = shop_finder_api.find_shops_many([f"Batch {i}" for i in range(lookups)], max_workers=workers, cache=False)
+    elapsed = time.perf_counter() - start
+    missing = sum(1 for shops in results.values() if shops is None)
+    print(f"find_shops_many: {lookups} in {elapsed:.2f}s -> {lookups / elapsed:.1f} lookups/s, {missing} without result")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Google Places Text Search API.")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (0 = any free port)")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="median simulated latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--bench", type=int, metavar="N", help="run N lookups against the stub and report throughput/latency")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent lookups during --bench")
+    args = parser.parse_args()
+
+    server = start_server(0 if args.bench else args.port, args.latency_ms, args.latency_sigma, args.error_rate, args.rate_limit)
+    if args.bench:
+        bench(server, args.bench, args.workers)
+        server.shutdown()
+        return
+    print(f"Places stub listening on http://127.0.0.1:{server.server_address[1]}{SEARCH_PATH}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# profile_match.py to rank the catalog for customer preference profiles (the sidebar filters, without the clicking)
+
+from collections import OrderedDict        # Import OrderedDict for the least-recently-used cache of answered profiles
+
+import numpy as np        # Import NumPy to score many profiles against the catalog at once
+
+from filter_index import ALL        # Same "no filter" value as the sidebar
+from instrumentation import count
+from similarity import UNKNOWN        # Code of a value that never occurs in the catalog (never matches anything)
+
+NO_PREFERENCE = -1        # Code of a profile field that is empty or "All"
+POSTING_KEY = 'brand'        # Filter with too many values to group on; it is matched through the index's row lists instead
+BLOCKED = -100        # Points of a group that fails a required filter (stays negative after any matches)
+CACHE_ITEMS = 65536        # Answered profiles kept per matcher (many customers share the same preferences)
+
+
+def normalize_field(name):
+    """Returns the spelling used to recognize profile fields ('  Gender ' matches 'gender')."""
+    return " ".join(str(name).casefold().split())
+
+
+class ProfileMatcher:
+    """
+    Ranks the catalog for preference profiles with one value (or none) per sidebar filter.
+
+    Everything a value means comes from the catalog's FilterIndex: its codes, its value
+    lookup and the brand's row lists. So a profile value matches exactly what choosing it
+    in the sidebar (or in /filter) matches: the same spelling, and never a missing value.
+    Only the field names are forgiving (filter key or column name, any case).
+
+    A profile is a set of sidebar choices, not a perfume. A perfume therefore scores one
+    point per filter the profile sets and the perfume matches, over all seven filters
+    (the tag similarity of "Show Similar Scents" compares the four SIGNATURE_COLUMNS of
+    two perfumes instead). `required` filters must match: the recommendations are always
+    among the rows FilterIndex.query() returns for the required part of the profile.
+    Ties are broken by catalog order.
+
+    The catalog is grouped once by its values on every filter but the brand, which has far
+    more values. A chunk of profiles is then scored against the groups (not the rows) in
+    one pass. Only the first `top_n` rows of the best `top_n` groups can make a profile's
+    top `top_n`, plus the best `top_n` rows of its preferred brand (one extra point each).
+    """
+
+    def __init__(self, index, top_n=10, required=(), cache_items=CACHE_ITEMS):
+        """
+        Args:
+            index (FilterIndex): Filter index of the perfume catalog.
+            top_n (int): Number of perfumes ranked per profile.
+            required (iterable): Filter keys a perfume must match (when the profile sets them).
+            cache_items (int): Answered profiles kept in the cache (0 disables it).
+        """
+        self.index = index
+        self.size = n = index.size
+        self.top_n = max(int(top_n), 1)
+        self.keys = list(index.columns)
+        self.required = set(required)
+        unknown = self.required - set(self.keys)
+        if unknown:
+            raise ValueError(f"unknown filters: {', '.join(sorted(unknown))}")
+        self.aliases = {normalize_field(k): k for k in self.keys}        # Profiles may use the filter key or the column name
+        self.aliases.update((normalize_field(column), key) for key, column in index.columns.items())
+
+        # Group the rows by their codes on every filter but the brand (mixed-radix key, so a plain 1-D unique suffices)
+        self.group_keys = [key for key in self.keys if key != POSTING_KEY]
+        stacked = np.column_stack([index.codes[key] for key in self.group_keys]).astype(np.int64) if self.group_keys \
+            else np.zeros((n, 0), dtype=np.int64)
+        radix = [len(index.categories[key]) + 1 for key in self.group_keys]
+        if float(np.prod(radix, dtype=float)) < 2 ** 62:
+            combined = np.zeros(n, dtype=np.int64)
+            for i, base in enumerate(radix):
+                combined = combined * base + stacked[:, i] + 1
+            _, first_row, group_of_row = np.unique(combined, return_index=True, return_inverse=True)
+        else:
+            _, first_row, group_of_row = np.unique(stacked, axis=0, return_index=True, return_inverse=True)
+        rank = np.empty(len(first_row), dtype=np.int64)        # Number the groups in the order of their first rows
+        rank[np.argsort(first_row)] = np.arange(len(first_row))
+        self.group_of_row = rank[group_of_row.ravel()]
+        self.group_codes = stacked[np.sort(first_row)]        # (groups x group keys)
+        order = np.argsort(self.group_of_row, kind='stable')
+        starts = np.searchsorted(self.group_of_row[order], np.arange(len(first_row) + 1))
+        slots = starts[:-1, None] + np.arange(self.top_n)
+        self.group_rows = np.where(slots < starts[1:, None], order[np.minimum(slots, max(n - 1, 0))], -1)        # First top_n rows per group
+        # Per group filter: (values + 1) x groups table of 0/1 points; its last row (no preference, unknown value) is all 0
+        self.group_points = [
+            np.vstack([self.group_codes[:, j] == np.arange(len(index.categories[key]))[:, None],
+                       np.zeros((1, len(first_row)), dtype=bool)]).astype(np.int8)
+            for j, key in enumerate(self.group_keys)
+        ]
+        self.has_postings = POSTING_KEY in self.keys
+        self.cache_items = cache_items
+        self._cache = OrderedDict()        # Encoded profile (bytes) -> (rows, scores)
+
+    def encode(self, profile):
+        """
+        Encodes one profile into one code per filter.
+
+        Args:
+            profile (dict): Filter key (or column name) -> preferred value, spelled like in the
+                catalog; empty values and "All" mean no preference.
+
+        Returns:
+            np.ndarray: int64 code per filter (NO_PREFERENCE, or UNKNOWN for values the catalog does not have).
+        """
+        codes = np.full(len(self.keys), NO_PREFERENCE, dtype=np.int64)
+        for field, value in profile.items():
+            key = self.aliases.get(normalize_field(field))
+            if key is None or value is None or value == "" or value == ALL:
+                continue
+            codes[self.keys.index(key)] = self.index.lookup[key].get(str(value), UNKNOWN)
+        return codes
+
+    def match(self, prefs):
+        """
+        Ranks the catalog for a chunk of encoded profiles.
+
+        Profiles answered before (in this chunk or an earlier one) come from the cache.
+
+        Args:
+            prefs (np.ndarray): (profiles x filters) codes from encode().
+
+        Returns:
+            list: One (rows, scores) pair of arrays per profile, best first.
+        """
+        prefs = np.asarray(prefs, dtype=np.int64).reshape(-1, len(self.keys))
+        keys = [row.tobytes() for row in prefs]
+        results = [self._cache.get(key) for key in keys]
+        todo = {}        # Distinct uncached profiles -> first position in the chunk
+        for i, (key, result) in enumerate(zip(keys, results)):
+            if result is None:
+                todo.setdefault(key, i)
+            elif self.cache_items:
+                self._cache.move_to_end(key)
+        count("profile_cache_hits", len(keys) - len(todo))
+        if todo:
+            positions = list(todo.values())
+            answers = self._score(prefs[positions])
+            count("profiles_scored", len(positions))
+            for key, answer in zip(todo, answers):
+                todo[key] = answer
+                if self.cache_items:
+                    self._cache[key] = answer
+            while len(self._cache) > self.cache_items:
+                self._cache.popitem(last=False)
+            results = [todo[key] if result is None else result for key, result in zip(keys, results)]
+        return results
+
+    def _score(self, prefs):
+        top_n = self.top_n
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        if self.size == 0:
+            return [empty] * len(prefs)
+        # Points of every group for every profile (profiles x groups); groups failing a required filter are BLOCKED
+        points = np.zeros((len(prefs), len(self.group_codes)), dtype=np.int8)
+        for key, table in zip(self.group_keys, self.group_points):
+            pref = prefs[:, self.keys.index(key)]
+            hit = table[np.where(pref >= 0, pref, len(table) - 1)]
+            points += hit
+            if key in self.required:
+                np.copyto(points, BLOCKED, where=(hit == 0) & (pref != NO_PREFERENCE)[:, None])
+        count("rows_scanned", points.size)
+
+        brand = self.keys.index(POSTING_KEY) if self.has_postings else None
+        brand_codes = self.index.codes[POSTING_KEY] if self.has_postings else None
+        results = []
+        for p in range(len(prefs)):
+            wanted = prefs[p, brand] if brand is not None else NO_PREFERENCE
+            if wanted == UNKNOWN and POSTING_KEY in self.required:
+                results.append(empty)
+                continue
+            rows, scores = [], []
+            if wanted < 0 or POSTING_KEY not in self.required:
+                # Only the first top_n rows of the best top_n groups can make the top_n
+                groups = _best(points[p], top_n)
+                candidates = self.group_rows[groups].ravel()
+                keep = candidates >= 0
+                if wanted >= 0:
+                    keep &= brand_codes[np.maximum(candidates, 0)] != wanted        # Scored with the brand below
+                rows.append(candidates[keep])
+                scores.append(np.repeat(points[p, groups], top_n)[keep])
+            if wanted >= 0:
+                # The preferred brand's rows, one extra point each
+                brand_rows = self.index.rows(POSTING_KEY, self.index.categories[POSTING_KEY][wanted])
+                brand_points = points[p][self.group_of_row[brand_rows]] + np.int8(1)
+                best = _best(brand_points, top_n)
+                rows.append(brand_rows[best])
+                scores.append(brand_points[best])
+            rows, scores = np.concatenate(rows).astype(np.int64), np.concatenate(scores).astype(np.int64)
+            order = np.lexsort((rows, -scores))[:top_n]
+            results.append((rows[order], scores[order]))
+        return results
+
+
+def _best(points, limit):
+    # Positions of the best `limit` entries by (points, position), skipping BLOCKED ones: best level first, in order
+    picked = []
+    for level in range(int(points.max(initial=-1)), -1, -1):
+        found = np.flatnonzero(points == level)[:limit]
+        picked.append(found)
+        limit -= len(found)
+        if limit == 0:
+            break
+    return np.concatenate(picked) if picked else np.empty(0, dtype=np.int64)
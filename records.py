@@ -0,0 +1,206 @@
+# records.py to pass perfumes between the app's stages as small views of the integer-coded catalog instead of pandas rows
+
+import numpy as np        # Import NumPy for the code arrays and the row positions
+import pandas as pd        # Import pandas to read the columns and to rebuild frames on request
+
+from filter_index import column_codes        # Same codes and dictionaries as the filter index
+
+DECODED_VALUES = 1 << 16        # Dictionaries up to this size are decoded into a list once; larger ones (the notes) per read
+
+
+def _value(categories, code):
+    # One decoded value as a plain Python object (None for code -1, a missing value)
+    if code < 0:
+        return None
+    value = categories[code]
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class CatalogTable:
+    """
+    The catalog as integer-coded columns with one shared dictionary of values per column.
+
+    Every column is an array with one small integer per perfume (int8 for the filter
+    columns) plus the pd.Index of its distinct values. For a catalog loaded from the
+    snapshot both are the categorical columns' own: the codes stay memory-mapped and the
+    dictionaries are the ones the DataFrame already holds, so the table costs next to no
+    memory of its own. Small dictionaries (names, brands, tags) are decoded into a Python
+    list on first read, so reading a field is one list lookup; the notes have too many
+    distinct values for that and are only turned into Python objects for the rows that
+    are read. A perfume is a row number into these arrays, so PerfumeRecord and ResultSet
+    hold no strings of their own.
+    """
+
+    def __init__(self, df):
+        """
+        Args:
+            df (pd.DataFrame): The perfume catalog.
+        """
+        self.size = len(df)
+        self.fields = list(df.columns)
+        self.codes = {}        # Column -> integer code per row
+        self.categories = {}        # Column -> pd.Index of distinct values (position = code)
+        self._dtypes = {}        # Column -> CategoricalDtype used by to_frame()
+        for column in self.fields:
+            self.codes[column], self.categories[column] = column_codes(df[column])
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                self._dtypes[column] = df[column].dtype        # Same dictionary as the DataFrame
+        self._decoded = {}        # Column -> list of values by code, None last (so code -1 reads it); small dictionaries only
+
+    def decoded(self, column):
+        """Returns the values of a column's dictionary as a list indexed by code (None last), or None if it is too large."""
+        values = self._decoded.get(column)
+        if values is None and len(self.categories[column]) <= DECODED_VALUES:
+            values = self._decoded[column] = self.categories[column].tolist() + [None]
+        return values
+
+    def value(self, column, row):
+        """Returns one field of the perfume at a row position (None if missing; KeyError for unknown columns)."""
+        code = self.codes[column][row]
+        values = self._decoded.get(column) or self.decoded(column)
+        return values[code] if values is not None else _value(self.categories[column], code)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the code arrays (the dictionaries come on top, once per catalog)."""
+        return sum(codes.nbytes for codes in self.codes.values())
+
+    def record(self, row):
+        """Returns the perfume at a row position."""
+        return PerfumeRecord(self, row)
+
+    def results(self, rows):
+        """Returns a ResultSet over row positions (without copying them if they are an int64 array)."""
+        return ResultSet(self, rows)
+
+    def column(self, column, rows):
+        """Returns the values of one column at the given row positions (missing values as None)."""
+        codes = self.codes[column][rows]
+        values = self.decoded(column)
+        if values is not None:
+            return [values[code] for code in codes.tolist()]
+        categories = self.categories[column]
+        if not len(categories):
+            return [None] * len(codes)
+        values = categories.take(np.maximum(codes, 0)).tolist()
+        return [None if code < 0 else value for code, value in zip(codes.tolist(), values)]
+
+    def to_dicts(self, rows):
+        """Returns the perfumes at the given row positions as plain dictionaries (missing values as None)."""
+        columns = [(column, self.column(column, rows)) for column in self.fields]
+        return [{column: values[i] for column, values in columns} for i in range(len(rows))]
+
+    def to_frame(self, rows, fields=None):
+        """Returns a DataFrame (categorical columns sharing this table's dictionaries) for the given row positions."""
+        frame = {}
+        for column in fields or self.fields:
+            if column not in self._dtypes:
+                self._dtypes[column] = pd.CategoricalDtype(self.categories[column])
+            frame[column] = pd.Categorical.from_codes(self.codes[column][rows], dtype=self._dtypes[column])
+        return pd.DataFrame(frame, index=pd.Index(rows, name='row'))
+
+
+class PerfumeRecord:
+    """
+    One perfume: a row number into a CatalogTable.
+
+    Reads like the dictionary or pandas row it replaces (p['name'], p.get('price')),
+    decoding a field only when it is read. Missing values read as None.
+    """
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        """
+        Args:
+            table (CatalogTable): The catalog the perfume belongs to.
+            row (int): Row position of the perfume in the catalog.
+        """
+        self.table = table
+        self.row = int(row)
+
+    def __getitem__(self, field):
+        return self.table.value(field, self.row)        # KeyError for unknown fields, like a dict
+
+    def get(self, field, default=None):
+        """Returns a field, or `default` if the field is unknown or missing for this perfume."""
+        if field not in self.table.codes:
+            return default
+        value = self.table.value(field, self.row)
+        return default if value is None else value
+
+    def keys(self):
+        return list(self.table.fields)
+
+    def __iter__(self):
+        return iter(self.table.fields)
+
+    def __len__(self):
+        return len(self.table.fields)
+
+    def __contains__(self, field):
+        return field in self.table.codes
+
+    def to_dict(self):
+        """Returns every field of the perfume as a plain dictionary."""
+        return {field: self[field] for field in self.table.fields}
+
+    def __eq__(self, other):
+        return isinstance(other, PerfumeRecord) and other.table is self.table and other.row == self.row
+
+    def __hash__(self):
+        return hash((id(self.table), self.row))
+
+    def __repr__(self):
+        return f"PerfumeRecord(row={self.row}, name={self.get('name')!r}, brand={self.get('brand')!r})"
+
+
+class ResultSet:
+    """
+    An ordered list of perfumes as row positions into a CatalogTable.
+
+    Handed from stage to stage (filter -> page -> chart) without copying: slicing gives
+    another view on the same row array, and iterating yields PerfumeRecords.
+    """
+
+    __slots__ = ('table', 'rows')
+
+    def __init__(self, table, rows):
+        """
+        Args:
+            table (CatalogTable): The catalog the rows point into.
+            rows (array-like): Row positions of the perfumes, in result order.
+        """
+        self.table = table
+        self.rows = np.asarray(rows, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        table = self.table
+        return (PerfumeRecord(table, row) for row in self.rows.tolist())
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return ResultSet(self.table, self.rows[item])
+        return PerfumeRecord(self.table, self.rows[item])
+
+    def take(self, positions):
+        """Returns the perfumes at the given positions of this result set (e.g. one sorted page)."""
+        return ResultSet(self.table, self.rows[positions])
+
+    def column(self, field):
+        """Returns one field of every perfume, in result order (missing values as None)."""
+        return self.table.column(field, self.rows)
+
+    def to_dicts(self):
+        """Returns the perfumes as plain dictionaries (e.g. for JSON)."""
+        return self.table.to_dicts(self.rows)
+
+    def to_frame(self, fields=None):
+        """Returns the perfumes as a DataFrame indexed by catalog row (only built when a frame is really needed)."""
+        return self.table.to_frame(self.rows, fields)
+
+    def __repr__(self):
+        return f"ResultSet({len(self.rows)} perfumes)"
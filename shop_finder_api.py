@@ -1,6 +1,133 @@
 # shop_finder_api.py to add feature to the main code (in perfume finder)
 
+import json        # Import json to store the cached shop lists on disk
+import os        # Import os to read the API key and endpoint from the environment
+import random        # Import random to spread out the retries of concurrent lookups (jitter)
+import sqlite3        # Import sqlite3 for the on-disk cache shared by every session (and every restart)
+import threading        # Import threading to share one connection pool safely between threads
+import time        # Import time for the deadlines and the retry backoff
+from collections import OrderedDict        # Import OrderedDict to keep the in-memory cache in least-recently-used order
+from concurrent.futures import Future, ThreadPoolExecutor, wait        # Import a thread pool to run several lookups at once
+
 import requests        # Import the 'requests' library to handle HTTP requests to external APIs
+from requests.adapters import HTTPAdapter        # Import the adapter that holds the pooled (kept-alive) connections
+
+from instrumentation import count, in_context, span, timed
+
+PLACES_URL = os.environ.get("PLACES_API_URL", "https://maps.googleapis.com/maps/api/place/textsearch/json")        # Google Places Text Search endpoint (can point to places_stub_server.py)
+API_KEY = os.environ.get("GOOGLE_PLACES_API_KEY", "")        # Google Places API key
+MAX_SHOPS = 5        # Number of shops returned per perfume
+REQUEST_TIMEOUT = 5.0        # Seconds one HTTP request may take before it is abandoned
+BATCH_DEADLINE = 15.0        # Seconds a whole batch may take; unfinished lookups are reported as None
+MAX_WORKERS = 8        # Maximum number of lookups running at the same time
+RETRIES = 2        # Extra attempts after a rate limit (429), a server error (5xx) or a network error
+BACKOFF = 0.25        # Seconds before the first retry; doubled for every further retry
+MAX_BACKOFF = 2.0        # Longest wait before a retry, whatever the server's Retry-After asks for
+LOOKUP_DEADLINE = REQUEST_TIMEOUT * 2        # Seconds a single lookup (all its attempts and waits) may take when no deadline is given
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CACHE_PATH = os.environ.get("SHOP_CACHE_PATH", ".shop_cache.sqlite3")        # SQLite file of the shop cache
+CACHE_TTL = 24 * 3600        # Seconds a cached shop list is fresh (shop availability barely changes within a day)
+CACHE_STALE = 6 * 24 * 3600        # Seconds after that during which the old list is still shown while it is refreshed
+CACHE_MEMORY_ITEMS = 2048        # Shop lists kept in memory in front of SQLite
+
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class ShopLookupError(Exception):
+    """Raised when a shop lookup fails after all retries (or runs out of time)."""
+
+
+def get_session():
+    """
+    Returns the HTTP session shared by all lookups of this process.
+
+    The session keeps connections to the Places API open, so repeated lookups skip the
+    TCP and TLS handshakes. Its pool is sized for MAX_WORKERS concurrent requests.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _retry_delay(response, attempt):
+    # Honour the server's Retry-After header when it sends one, otherwise back off exponentially with jitter (never above MAX_BACKOFF)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after is not None:
+        try:
+            return min(max(float(retry_after), 0.0), MAX_BACKOFF)
+        except ValueError:
+            pass
+    return min(BACKOFF * (2 ** attempt) * (0.5 + random.random()), MAX_BACKOFF)
+
+
+def fetch_shops(perfume_name, location="Zurich", timeout=REQUEST_TIMEOUT, retries=RETRIES, deadline=None, session=None):
+    """
+    Looks up the shops selling a perfume, retrying temporary failures.
+
+    Args:
+        perfume_name (str): The name of the perfume to search for.
+        location (str): The location to search around.
+        timeout (float): Seconds allowed per HTTP request.
+        retries (int): Extra attempts after a 429, a 5xx or a network error.
+        deadline (float): time.monotonic() value after which no request is started and no
+            retry is waited for (default: LOOKUP_DEADLINE seconds from now).
+        session (requests.Session): Session to use (defaults to the shared pooled session).
+
+    Returns:
+        list: A list of dictionaries with 'name' and 'address' of found shops.
+
+    Raises:
+        ShopLookupError: If the lookup did not succeed within the retries or the deadline.
+    """
+    session = session or get_session()
+    if deadline is None:        # Never let a lookup (and the page waiting for it) hang without bound
+        deadline = time.monotonic() + LOOKUP_DEADLINE
+    params = {'query': f"{perfume_name} perfume store near {location}", 'key': API_KEY}        # Text-based search query combining perfume name and location
+    error = None
+    for attempt in range(retries + 1):
+        request_timeout = min(timeout, deadline - time.monotonic())
+        if request_timeout <= 0:
+            break
+        response = None
+        count("places_api_calls")
+        try:
+            with span("places_request"):
+                response = session.get(PLACES_URL, params=params, timeout=request_timeout)
+            if response.status_code in RETRY_STATUSES:
+                error = ShopLookupError(f"HTTP {response.status_code}")
+            else:
+                response.raise_for_status()
+                data = response.json()        # Convert the JSON response into a Python dictionary
+                if data.get('status') != 'OVER_QUERY_LIMIT':        # Places reports its rate limit inside a 200 response
+                    return [
+                        {
+                            'name': place.get('name', 'Unknown Shop'),        # Use 'Unknown Shop' if name is missing
+                            'address': place.get('formatted_address', 'No address available'),        # Fallback address if missing
+                        }
+                        for place in data.get('results', [])[:MAX_SHOPS]
+                    ]
+                error = ShopLookupError("OVER_QUERY_LIMIT")
+        except (requests.ConnectionError, requests.Timeout) as e:        # Network problems are worth another try
+            error = e
+        except (requests.RequestException, ValueError) as e:        # Anything else (4xx, invalid JSON) will not get better
+            raise ShopLookupError(str(e)) from e
+        if attempt < retries:
+            delay = _retry_delay(response, attempt)
+            if time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+    raise ShopLookupError(f"Lookup for {perfume_name!r} failed: {error or 'deadline exceeded'}")
+
 
 def find_shops(perfume_name, location="Zurich"):
     """
@@ -13,23 +140,260 @@ def find_shops(perfume_name, location="Zurich"):
     Returns:
         list: A list of dictionaries with 'name' and 'address' of found shops.
     """
-    api_key = ""      # Google Places API key
-    search_query = f"{perfume_name} perfume store near {location}"        # Construct a text-based search query combining perfume name and location
-    url = f"https://maps.googleapis.com/maps/api/place/textsearch/json?query={search_query}&key={api_key}"        # Build the full request URL for the Google Places Text Search API
-
     try:
-        response = requests.get(url)        # Send a GET request to the API endpoint using the constructed URL
-        data = response.json()        # Convert the JSON response into a Python dictionary
-        results = data.get('results', [])        # Get the list of places (shops) from the API response; default to empty list if key is missing
-
-        shops = []        # Initialize an empty list to store extracted shop data
-        for place in results[:5]:  # Iterate over the first 5 results from the API response
-            shops.append({        # Extract the name and address of each place and add it to the shops list
-                'name': place.get('name', 'Unknown Shop'),        # Use 'Unknown Shop' if name is missing
-                'address': place.get('formatted_address', 'No address available')           # Fallback address if missing
-            })
-        return shops        # Return the list of found shops as dictionaries with name and address
-
+        return fetch_shops(perfume_name, location)
     except Exception as e:        # If any error occurs during the request or data handling, catch it and print the error message
         print(f"Error fetching shop data: {e}")
         return []        # Return an empty list to indicate that no shops were found or an error occurred
+
+
+def cache_key(perfume_name, location):
+    """Normalizes a (perfume, location) pair so that 'Sauvage ', 'sauvage' and 'SAUVAGE' share a cache entry."""
+    return f"{' '.join(str(perfume_name).casefold().split())}|{' '.join(str(location).casefold().split())}"
+
+
+class ShopCache:
+    """
+    Cache of shop lookups keyed by the normalized (perfume, location).
+
+    Two tiers: an in-memory LRU shared by all sessions of the process, in front of an
+    SQLite file that survives restarts. Entries are fresh for `ttl` seconds. For `stale`
+    seconds after that the old list is still returned immediately while one background
+    lookup refreshes it (stale-while-revalidate). Concurrent lookups of the same key are
+    coalesced, so only one request goes upstream and the other callers wait for its answer.
+    Failed lookups are never cached. The SQLite tier is best effort: if the file cannot be
+    opened the cache runs in memory only, and a failing read or write is logged and skipped.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, stale=CACHE_STALE, max_items=CACHE_MEMORY_ITEMS, fetch=None):
+        """
+        Args:
+            path (str): SQLite file (":memory:" keeps everything in memory).
+            ttl (float): Seconds an entry is fresh.
+            stale (float): Seconds after `ttl` during which a stale entry is served while refreshing.
+            max_items (int): Entries kept in the in-memory tier.
+            fetch (callable): fetch(perfume_name, location, **options) doing the real lookup
+                (defaults to fetch_shops).
+        """
+        self.ttl = ttl
+        self.stale = stale
+        self.max_items = max_items
+        self.fetch = fetch or fetch_shops
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'stale_hits': 0, 'misses': 0, 'upstream_calls': 0}
+        self._memory = OrderedDict()        # key -> (stored_at, shops), least recently used first
+        self._inflight = {}        # key -> Future of the lookup currently running for that key
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None        # SQLite connection; None when the file cannot be used (memory-only cache)
+        try:
+            db = sqlite3.connect(path, check_same_thread=False)
+            with self._db_lock, db:
+                db.execute("PRAGMA journal_mode=WAL")        # Readers in other processes are not blocked by a writer
+                db.execute("CREATE TABLE IF NOT EXISTS shops (key TEXT PRIMARY KEY, stored_at REAL NOT NULL, shops TEXT NOT NULL)")
+            self._db = db
+        except sqlite3.Error as e:        # Locked, read-only or unreadable file: keep the in-memory tier working
+            print(f"Shop cache running in memory only ({path}: {e})")
+
+    def _tally(self, name):
+        # Count a cache event in the stats and in the running recording (caller holds self._lock)
+        self.stats[name] += 1
+        count(f"shop_cache_{name}")
+
+    def _remember(self, key, entry):
+        # Put an entry at the most-recently-used end of the memory tier (caller holds self._lock)
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _read(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._tally('memory_hits')
+                return entry
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute("SELECT stored_at, shops FROM shops WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:        # Treat an unreadable disk tier as a miss
+            print(f"Could not read the shop cache: {e}")
+            return None
+        if row is None:
+            return None
+        entry = (row[0], json.loads(row[1]))
+        with self._lock:
+            self._remember(key, entry)
+            self._tally('disk_hits')
+        return entry
+
+    def _write(self, key, shops):
+        entry = (time.time(), shops)
+        with self._lock:
+            self._remember(key, entry)
+        if self._db is None:
+            return
+        try:
+            with self._db_lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO shops (key, stored_at, shops) VALUES (?, ?, ?)",
+                                 (key, entry[0], json.dumps(shops)))
+        except sqlite3.Error as e:        # The answer was fetched already; only the disk copy is lost
+            print(f"Could not write the shop cache: {e}")
+
+    def _lookup(self, key, perfume_name, location, options):
+        # Run the upstream lookup for a key, or join the one that is already running
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self._tally('upstream_calls')
+        if leader:
+            try:
+                shops = self.fetch(perfume_name, location, **options)
+                self._write(key, shops)
+                future.set_result(shops)
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        return future.result()
+
+    def _refresh(self, key, perfume_name, location, options):
+        # Revalidate a stale entry in the background (unless a lookup for it is already running)
+        with self._lock:
+            if key in self._inflight:
+                return
+
+        def run():
+            try:
+                self._lookup(key, perfume_name, location, options)
+            except Exception as e:        # The stale list stays in place until a later refresh succeeds
+                print(f"Error refreshing shop data: {e}")
+
+        threading.Thread(target=run, daemon=True, name="shop_cache_refresh").start()
+
+    def get(self, perfume_name, location="Zurich", **options):
+        """
+        Returns the shops selling a perfume, from the cache when possible.
+
+        Args:
+            perfume_name (str): The name of the perfume to search for.
+            location (str): The location to search around.
+            **options: Passed on to the fetch function on a miss (timeout, deadline, ...).
+
+        Returns:
+            list: A list of dictionaries with 'name' and 'address' of found shops.
+
+        Raises:
+            ShopLookupError: If the lookup was needed and failed.
+        """
+        key = cache_key(perfume_name, location)
+        entry = self._read(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < self.ttl:
+                return entry[1]
+            if age < self.ttl + self.stale:
+                with self._lock:
+                    self._tally('stale_hits')
+                self._refresh(key, perfume_name, location, options)
+                return entry[1]
+        with self._lock:
+            self._tally('misses')
+        return self._lookup(key, perfume_name, location, options)
+
+    def purge(self):
+        """Deletes the entries that are too old to be served, even as stale."""
+        cutoff = time.time() - self.ttl - self.stale
+        with self._lock:
+            for key in [k for k, (stored_at, _) in self._memory.items() if stored_at < cutoff]:
+                del self._memory[key]
+        if self._db is None:
+            return
+        try:
+            with self._db_lock, self._db:
+                self._db.execute("DELETE FROM shops WHERE stored_at < ?", (cutoff,))
+        except sqlite3.Error as e:
+            print(f"Could not purge the shop cache: {e}")
+
+
+def get_cache():
+    """Returns the shop cache shared by all sessions of this process."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ShopCache()
+    return _cache
+
+
+def find_shops_cached(perfume_name, location="Zurich"):
+    """
+    Same as find_shops, but answered from the shared shop cache when possible.
+
+    Args:
+        perfume_name (str): The name of the perfume to search for.
+        location (str): The location to search around. Default is 'Zurich'.
+
+    Returns:
+        list: A list of dictionaries with 'name' and 'address' of found shops.
+    """
+    try:
+        return get_cache().get(perfume_name, location)
+    except Exception as e:
+        print(f"Error fetching shop data: {e}")
+        return []
+
+
+@timed("find_shops_many")
+def find_shops_many(perfume_names, location="Zurich", max_workers=MAX_WORKERS, timeout=REQUEST_TIMEOUT,
+                    deadline=BATCH_DEADLINE, retries=RETRIES, cache=None):
+    """
+    Looks up the shops of several perfumes concurrently over pooled connections.
+
+    At most max_workers requests run at the same time. Every request is limited to
+    `timeout` seconds, and the whole batch to `deadline` seconds: whatever has not
+    finished by then is left out instead of holding up the caller.
+
+    Args:
+        perfume_names (list): Names of the perfumes to search for (duplicates are looked up once).
+        location (str): The location to search around. Default is 'Zurich'.
+        max_workers (int): Maximum number of concurrent lookups.
+        timeout (float): Seconds allowed per HTTP request.
+        deadline (float): Seconds allowed for the whole batch.
+        retries (int): Extra attempts per lookup after a 429, a 5xx or a network error.
+        cache (ShopCache): Cache consulted before going upstream (defaults to the shared
+            cache; pass False to always call the API).
+
+    Returns:
+        dict: Perfume name -> list of shops (as returned by find_shops), or None when the
+        lookup failed or did not finish before the deadline.
+    """
+    names = list(dict.fromkeys(perfume_names))        # Drop duplicates but keep the order
+    results = dict.fromkeys(names)
+    if not names:
+        return results
+    stop_at = time.monotonic() + deadline
+    if cache is None:
+        cache = get_cache()
+    lookup = cache.get if cache else fetch_shops
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(names)), thread_name_prefix="find_shops")
+    try:
+        futures = {
+            # in_context() lets the lookups count their API calls and cache hits into the caller's recording
+            pool.submit(in_context(lookup), name, location, timeout=timeout, retries=retries, deadline=stop_at): name
+            for name in names
+        }
+        done, _ = wait(futures, timeout=max(stop_at - time.monotonic(), 0))
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:        # A failed lookup only loses its own result
+                print(f"Error fetching shop data: {e}")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)        # Do not wait for stragglers; their requests time out on their own
+    return results
@@ -0,0 +1,185 @@
+# similarity.py to find the perfumes that share the most tags with a given perfume (used by "Show Similar Scents")
+
+import numpy as np        # Import NumPy to score the whole catalog in one vectorized pass
+
+from filter_index import encode_column        # Reuse the same dictionary encoding as the filter index
+from instrumentation import count
+
+# Tag columns compared between two perfumes; each matching tag adds one point to the score
+SIGNATURE_COLUMNS = ('scent_direction', 'season', 'occasion', 'personality')
+
+UNKNOWN = -2        # Code of a query tag that never occurs in the catalog (never matches anything)
+MAX_SPARE = 8        # Extra precomputed candidates per signature, to make up for skipped same-name perfumes
+
+
+class SimilarityEngine:
+    """
+    Tag-match similarity over an integer-encoded catalog.
+
+    The tag columns are dictionary-encoded into an (n_items x n_tags) int32 matrix once.
+    A query scores every perfume in one NumPy pass and keeps the top k with a partial
+    selection. Ties are broken by catalog order, and perfumes with the same name as the
+    query are never returned. Optionally, every item's k nearest neighbours can be
+    precomputed so that a lookup replaces the scoring entirely.
+    """
+
+    def __init__(self, df, columns=SIGNATURE_COLUMNS, precompute_k=0):
+        """
+        Args:
+            df (pd.DataFrame): The perfume catalog (must contain 'name' and the tag columns).
+            columns (tuple): Tag columns to compare.
+            precompute_k (int): If > 0, precompute that many neighbours for every item.
+        """
+        self.size = len(df)
+        self.columns = tuple(columns)
+        self.lookup = []        # Per tag column: {value: code}
+        encoded = []
+        for column in self.columns:
+            codes, categories = encode_column(df[column])
+            encoded.append(codes)
+            self.lookup.append({value: code for code, value in enumerate(categories)})
+        self.matrix = np.column_stack(encoded) if encoded else np.empty((self.size, 0), dtype=np.int32)
+        self.names, names = encode_column(df['name'])        # Name codes, used to skip the query perfume itself
+        self._name_lookup = {value: code for code, value in enumerate(names)}
+        self.neighbours = None        # (n_items x k) row positions once precomputed (-1 pads missing slots)
+        self.complete = None        # Per item: True if its precomputed neighbours are exact
+        if precompute_k > 0:
+            self.precompute(precompute_k)
+
+    def encode(self, record):
+        """Encodes a perfume (dict-like with .get) into its tag codes and name code."""
+        codes = np.array(
+            [lookup.get(record.get(column), UNKNOWN) for column, lookup in zip(self.columns, self.lookup)],
+            dtype=np.int32,
+        )
+        return codes, self._name_lookup.get(record.get('name'), UNKNOWN)
+
+    def scores(self, codes):
+        """Returns the number of matching tags for every catalog item (int8 array)."""
+        codes = np.where(codes < 0, UNKNOWN, codes)        # A missing tag never matches, not even another missing tag
+        return (self.matrix == codes).sum(axis=1, dtype=np.int8)
+
+    def top_k(self, record, k=3):
+        """
+        Finds the k perfumes sharing the most tags with a perfume.
+
+        Args:
+            record (dict-like): The perfume to compare against (e.g. a pandas Series).
+            k (int): Number of similar perfumes to return.
+
+        Returns:
+            np.ndarray: Row positions of the most similar perfumes, best first.
+        """
+        codes, name = self.encode(record)
+        count("rows_scanned", self.size)
+        scores = self.scores(codes)
+        excluded = self.names == name if name != UNKNOWN else None
+        return self._select(scores, excluded, k)
+
+    def _select(self, scores, excluded, k):
+        # Rank key: higher score first, then catalog order; excluded items are pushed past every real candidate
+        n = self.size
+        key = (len(self.columns) - scores.astype(np.int64)) * n + np.arange(n)
+        if excluded is not None:
+            key[excluded] = np.iinfo(np.int64).max
+        k = min(k, n)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.argpartition(key, k - 1)[:k] if k < n else np.arange(n)
+        candidates = candidates[np.argsort(key[candidates])]
+        if excluded is not None:
+            candidates = candidates[~excluded[candidates]]
+        return candidates
+
+    def similar_to_row(self, row, k=3):
+        """
+        Finds the k perfumes most similar to the catalog item at a given row position.
+
+        Uses the precomputed neighbour table when it holds at least k neighbours.
+        """
+        if self.neighbours is not None and k <= self.neighbours.shape[1] and self.complete[row]:
+            found = self.neighbours[row, :k]
+            return found[found >= 0]
+        count("rows_scanned", self.size)
+        scores = self.scores(self.matrix[row])
+        excluded = self.names == self.names[row] if self.names[row] >= 0 else np.arange(self.size) == row
+        return self._select(scores, excluded, k)
+
+    def use_neighbours(self, neighbours, complete):
+        """Installs a neighbour table computed earlier by precompute() (e.g. loaded from a snapshot)."""
+        self.neighbours = neighbours
+        self.complete = complete
+
+    def precompute(self, k=3, budget=1 << 22):
+        """
+        Precomputes every item's k nearest neighbours.
+
+        Items with identical tags share the same ranking, so each distinct tag signature
+        is scored once against the other distinct signatures. Only the first few catalog
+        rows of each signature can ever make a top-k list. Items whose name repeats so often
+        that the spare candidates run out are marked incomplete and scored on demand.
+
+        Args:
+            k (int): Number of neighbours to keep per item.
+            budget (int): Approximate number of candidate scores held in memory at once.
+        """
+        n = self.size
+        if n == 0 or k <= 0:
+            self.neighbours = np.full((n, max(k, 0)), -1, dtype=np.int64)
+            self.complete = np.ones(n, dtype=bool)
+            return self.neighbours
+        signatures, sig_of_row = np.unique(self.matrix, axis=0, return_inverse=True)
+        sig_of_row = sig_of_row.ravel()
+        # Every row sharing a name with the query is excluded, so keep enough spare candidates
+        named = self.names[self.names >= 0]
+        spare = max(int(np.bincount(named).max()) if len(named) else 0, 1)
+        depth = k + min(spare, MAX_SPARE)
+        # First `depth` rows (in catalog order) of every signature
+        order = np.argsort(sig_of_row, kind='stable')
+        starts = np.searchsorted(sig_of_row[order], np.arange(len(signatures) + 1))
+        offsets = np.arange(depth)
+        slots = starts[:-1, None] + offsets        # (n_signatures x depth) positions into `order`
+        valid = slots < starts[1:, None]
+        firsts = np.where(valid, order[np.minimum(slots, n - 1)], -1)
+        n_sigs = len(signatures)
+        take_sigs = min(depth, n_sigs)
+        ranked = np.empty((n_sigs, depth), dtype=np.int64)
+        width = len(self.columns)
+        block = max(1, budget // (n_sigs * max(width, 1)))        # Number of query signatures scored together
+        for lo in range(0, n_sigs, block):
+            chunk = signatures[lo:lo + block]
+            sig_scores = np.zeros((len(chunk), n_sigs), dtype=np.int64)        # (block x n_signatures)
+            for column in range(width):        # One tag at a time is much faster than reducing over a short last axis
+                sig_scores += (chunk[:, column, None] == signatures[None, :, column]) & (chunk[:, column, None] >= 0)
+            # A row can only make the top `depth` if the first row of its signature does too, so rank the
+            # signatures by (score, first row) and only expand the best `depth` of them into candidate rows
+            sig_key = (width - sig_scores) * n + firsts[:, 0]
+            top = np.argpartition(sig_key, take_sigs - 1, axis=1)[:, :take_sigs] if take_sigs < n_sigs \
+                else np.broadcast_to(np.arange(n_sigs), sig_key.shape)
+            candidates = firsts[top].reshape(len(chunk), -1)        # (block x take_sigs * depth) rows, -1 = empty slot
+            scores = np.repeat(np.take_along_axis(sig_scores, top, axis=1), depth, axis=1)
+            key = np.where(candidates >= 0, (width - scores) * n + candidates, np.iinfo(np.int64).max)
+            take = min(depth, key.shape[1])
+            best = np.argpartition(key, take - 1, axis=1)[:, :take]
+            best = np.take_along_axis(best, np.argsort(np.take_along_axis(key, best, axis=1), axis=1), axis=1)
+            ranked[lo:lo + block, :take] = np.take_along_axis(candidates, best, axis=1)
+            ranked[lo:lo + block, take:] = -1
+        # Drop each item's own name from its signature's ranking and keep the first k survivors
+        neighbours = np.full((n, k), -1, dtype=np.int64)
+        complete = np.empty(n, dtype=bool)
+        exhausted = (ranked < 0).any(axis=1)        # The signature's ranking already lists every other perfume
+        step = max(1, budget // depth)
+        for lo in range(0, n, step):
+            items = np.arange(lo, min(lo + step, n))
+            candidates = ranked[sig_of_row[items]]        # (items x depth)
+            names = self.names[items, None]
+            keep = (candidates >= 0) & ((self.names[np.maximum(candidates, 0)] != names) | (names < 0))
+            keep &= candidates != items[:, None]        # Items without a name only skip themselves
+            pick = np.argsort(~keep, axis=1, kind='stable')[:, :k]
+            found = np.take_along_axis(candidates, pick, axis=1)
+            found[~np.take_along_axis(keep, pick, axis=1)] = -1
+            neighbours[items, :found.shape[1]] = found
+            complete[items] = (keep.sum(axis=1) >= k) | exhausted[sig_of_row[items]]
+        self.neighbours = neighbours
+        self.complete = complete
+        return neighbours
@@ -2,38 +2,60 @@
 
 # Import different services to build web app, work with tables and data, and create graphs.
 import streamlit as st
-import pandas as pd
 import altair as alt
-from shop_finder_api import find_shops  
-
-# Load perfume dataset (in CSV format) using pandas
-df = pd.read_csv("Perfumes.csv", sep=";", encoding="utf-8")
-# Stored in df; uses semicolons as separators due to CSV formatting; utf-8 encoding ensures special characters are read properly
-
-# Configure session state variables for app memory
-if "started" not in st.session_state:
-    st.session_state.started = False     #Indicates if the user has clicked "Start Now"
-
-if "show_results" not in st.session_state:
-    st.session_state.show_results = False     #Indicates if user has clicked "Show results"
-# These initialize both to False when app is opened to have a clean intro screen
-
-# Set page layout depending on whether app has been started
-if not st.session_state.started:
-    st.set_page_config(
-        page_title="Your Perfect Fragrance",    # Sets title in browser tab
-        layout="wide",                          # Uses wide page layout
-        initial_sidebar_state="collapsed"       # Sidebar is hidden initially
-    )
-# Page configuration in initial state with clean intro screen
-
-else:
-    st.set_page_config(
-        page_title="Your Perfect Fragrance",    # Same title
-        layout="wide",                          # Same layout
-        initial_sidebar_state="expanded"        # Sidebar is visible after start
-    )
-# Once the user clicks "Start Now", the app remembers that with session_state and opens up the full layout with sidebar filters
+from shop_finder_api import find_shops_cached
+from filter_index import FilterIndex
+from catalog import SORT_OPTIONS, load_catalog, price_chart_data
+from records import CatalogTable
+import instrumentation
+from instrumentation import span, timed
+
+# Hidden debug mode: open the app with ?debug=1 (or set PERFUME_DEBUG=1) to time every stage of each rerun and show a debug panel in the sidebar
+DEBUG = instrumentation.debug_enabled(st.query_params.get("debug"))
+# Record this rerun from here on (with a cProfile capture if it was switched on in the debug panel); when debug mode is off nothing is recorded
+rerun_recording = instrumentation.start_recording("rerun", profile=st.session_state.get("debug_profile", False)) if DEBUG else None
+DEBUG_HISTORY = 20    # Reruns of this session kept for the JSON-lines download
+
+# Everything from here to main() runs inside the recording, so finish it if the setup stops the script early
+try:
+    # Load perfume dataset (in CSV format) through the shared catalog loader
+    with span("load_catalog"):
+        catalog = load_catalog("Perfumes.csv")
+    # The CSV is parsed once per process (later runs reuse a binary snapshot) and the same catalog is shared by every session and rerun
+    df = catalog.df    # The perfume table (one row per perfume)
+    perfume_index = catalog.filter_index    # Filter bitmaps built once for the loaded catalog so filtering does not loop over every row
+    similarity_engine = catalog.similarity    # Encoded tags with every perfume's 3 most similar perfumes precomputed
+    perfume_table = catalog.table    # Integer-coded columns with shared value dictionaries; results are row positions into it, so no session copies any perfume data
+    PAGE_SIZES = [10, 25, 50]    # Choices for the number of perfumes shown per page (the first one is the default)
+
+    # Configure session state variables for app memory
+    if "started" not in st.session_state:
+        st.session_state.started = False     #Indicates if the user has clicked "Start Now"
+
+    if "show_results" not in st.session_state:
+        st.session_state.show_results = False     #Indicates if user has clicked "Show results"
+    # These initialize both to False when app is opened to have a clean intro screen
+
+    # Set page layout depending on whether app has been started
+    if not st.session_state.started:
+        st.set_page_config(
+            page_title="Your Perfect Fragrance",    # Sets title in browser tab
+            layout="wide",                          # Uses wide page layout
+            initial_sidebar_state="collapsed"       # Sidebar is hidden initially
+        )
+    # Page configuration in initial state with clean intro screen
+
+    else:
+        st.set_page_config(
+            page_title="Your Perfect Fragrance",    # Same title
+            layout="wide",                          # Same layout
+            initial_sidebar_state="expanded"        # Sidebar is visible after start
+        )
+    # Once the user clicks "Start Now", the app remembers that with session_state and opens up the full layout with sidebar filters
+except BaseException:    # Includes st.stop() and st.rerun(), which Streamlit raises as exceptions
+    if rerun_recording is not None:
+        instrumentation.finish_recording(rerun_recording)
+    raise
 
 
 # Define custom function "set_background", which will apply a series of CSS styles to the app
@@ -114,84 +136,88 @@ def show_intro(): # Defined a function called show_intro that when called render
 # all image downloaded from Safari: https://unsplash.com/de/s/fotos/perfume
 
 # Sidebar filters
-def render_sidebar_filters(df):    
-# Defines a function that takes the perfume DataFrame df as input to set up interactive filters in the sidebar and returns selected values as dictionary
+# Dropdowns of the sidebar in display order: brand, gender (e.g. Male, Female, Unisex), scent direction (e.g. Floral, Woody),
+# suitable season (e.g. Spring, Winter), personality match (e.g. Confident, Romantic), usage occasion (e.g. Everyday, Formal) and price level (e.g. Low, High)
+FILTER_LABELS = {
+    'brand': "Brand",
+    'gender': "Gender",
+    'scent': "Scent",
+    'season': "Season",
+    'personality': "Personality",
+    'occasion': "Occasion",
+    'price': "Price",
+}
+
+@timed("sidebar_filters")
+def render_sidebar_filters(options, facets):    
+# Defines a function that takes the precomputed filter options (catalog.options) and the facet engine (catalog.facets) as input
+# to set up interactive filters in the sidebar and returns selected values as dictionary
     st.sidebar.title("Your Signature Scent")    # Adds title at the top of the sidebar
     st.sidebar.markdown("### Matched to yourself")    # Adds a smaller title below the other to guide the user
-    # Returns a dictionary with user-selected filter values from the sidebar
-    return {
-        # Dropdown for selecting brand; includes "All" plus unique, non-null brands from the dataset
-        'brand': st.sidebar.selectbox("Brand", ["All"] + sorted(df["brand"].dropna().unique())),
-        # Dropdown for selecting gender (e.g. Male, Female, Unisex)
-        'gender': st.sidebar.selectbox("Gender", ["All"] + sorted(df["gender"].dropna().unique())),
-        # Dropdown for selecting scent direction (e.g. Floral, Woody, etc.)
-        'scent': st.sidebar.selectbox("Scent", ["All"] + sorted(df["scent_direction"].dropna().unique())),
-        # Dropdown for selecting suitable season (e.g. Spring, Winter)
-        'season': st.sidebar.selectbox("Season", ["All"] + sorted(df["season"].dropna().unique())),
-        # Dropdown for selecting personality match (e.g. Confident, Romantic)
-        'personality': st.sidebar.selectbox("Personality", ["All"] + sorted(df["personality"].dropna().unique())),
-        # Dropdown for selecting usage occasion (e.g. Everyday, Formal)
-        'occasion': st.sidebar.selectbox("Occasion", ["All"] + sorted(df["occasion"].dropna().unique())),
-        # Dropdown for selecting price level (e.g. Low, High)
-        'price': st.sidebar.selectbox("Price", ["All"] + sorted(df["price"].dropna().unique())),
-    }
-    # '...' is the name of the box of the dropdown; Selectbox triggers the dropdown for user to select from; 
-    # dropna() removes any rows where the value is missing; unique() assures that value is named only once and not repeated
+    # Read the current choices (Streamlit keeps them under each dropdown's key) before drawing, so the counts match them
+    current = {key: st.session_state.get(f"filter_{key}", "All") for key in FILTER_LABELS}
+    with span("facet_counts"):
+        counts = facets.options(current, options)    # For every dropdown: how many perfumes each option would give together with the other choices
+    filters = {}    # Dictionary with user-selected filter values from the sidebar
+    for key, label in FILTER_LABELS.items():
+        # Keep "All" plus the options that still give at least one perfume (and the current choice, so it never disappears)
+        choices = ["All"] + [value for value in options[key] if counts[key][value] > 0 or value == current[key]]
+        filters[key] = st.sidebar.selectbox(
+            label, choices, key=f"filter_{key}",
+            format_func=lambda value, c=counts[key]: f"{value} ({c[value]})",    # Show the number of matching perfumes next to each option
+        )
+    return filters
+    # Selectbox triggers the dropdown for user to select from; options[...] holds the sorted, unique, non-null values of each column,
+    # computed once when the catalog is loaded, and the facet counts are computed from the precomputed filter bitmaps
 
 # Filter perfumes based on sidebar input
-def filter_perfumes(df, filters):
+@timed("filter_perfumes")
+def filter_perfumes(df, filters, index=None, table=None):
 # Define a function that filters the perfume dataset based on the selected sidebar filters
-# Takes in two parameters: df (the full DataFrame containing all perfume entries) and filters (a dictionary with user-selected filter values)
-    filtered = []        # Create empty list to store perfumes that match all selected filters
-    for _, p in df.iterrows():    # Loop for each row (perfume) in the DataFrame
-        if filters["brand"] != "All" and p["brand"] != filters ["brand"]: 
-            continue
-        # If a a specific brand is selected and the perfume doesn't match, skip it
-        if filters["gender"] != "All" and p["gender"] != filters ["gender"]:
-            continue
-        # If a specific gender is selected and this perfume doesn't match, skip it
-        if filters["scent"] != "All" and p["scent"] != filters ["scent"]:
-            continue
-        # If a specific scent is selected and this perfume doesn't match, skip it
-        if filters["season"] != "All" and p["season"] != filters ["season"]:
-            continue
-        # If a specific season is selected and this perfume doesn't match, skip it
-        if filters["occasion"] != "All" and p["occasion"] != filters ["occasion"]:
-            continue
-        # If a specific occasion is selected and this perfume doesn't match, skip it
-        if filters["personality"] != "All" and p["personality"] != filters ["personality"]:
-            continue
-        # If a specific personality is selected and this perfume doesn't match, skip it
-        if filters["price"] != "All" and p["price"] != filters ["price"]:
-            continue
-        # If a specific price is selected and this perfume doesn't match, skip it
-        filtered.append(p)    # If none of the filters ruled it out, the perfume is a match and added to the result list
-    return filtered    # Return the list of perfumes that matched all active filters
+# Takes in df (the full DataFrame containing all perfume entries), filters (a dictionary with user-selected filter values),
+# index (the FilterIndex built once for this df) and table (its CatalogTable); both are built on the spot if not given
+    if index is None:
+        index = FilterIndex(df)
+    if table is None:
+        table = CatalogTable(df)
+    return table.results(index.query(filters))    # Intersect the precomputed bitmaps of every selected value and wrap the row positions of the matches (catalog order) in a ResultSet
+    # Only row positions are passed around; a perfume's fields are decoded from the table when the page that shows it reads them
 
+@timed("similar_perfumes")
 def get_similar_perfumes_tagmatch(p, max_results=3):
-    signature = {
-        'scent_direction': p.get('scent_direction'), 
-        'season': p.get('season'), 
-        'occation': p.get('gender'), 
-        'personality': p.get('personality')
-    }
-    scored = []
-    for _, other in df.iterrows(): 
-        if other['name'] == p['name']:
-            continue
-        score = sum(1 for key in signature if other.get(key) == signature[key])
-        scored.append((other, score))
-    top = sorted(scored, key=lambda x: x[1], reverse = True)[:max_results]
-    return [x[0] for x in top]
-
-# Define a function that displays a list of perfume matches along with an interactive option (shop finder)
-def display_results(results):    # Takes in 'results', which is a list of perfume dictionaries matching the user's filters
+# Define a function that finds the perfumes sharing the most tags (scent direction, season, occasion, personality) with perfume p
+    rows = similarity_engine.similar_to_row(p.row, max_results)    # Look up the precomputed nearest neighbours of its catalog row (best match first)
+    return perfume_table.results(rows)
+
+# Define a function that displays one page of perfume matches along with interactive options (shop finder, similar scents)
+@timed("display_results")
+def display_results(results):    # Takes in 'results', the ResultSet of all perfumes matching the user's filters
     st.markdown("### Matching Fragrances")    # Print a section title above the results using markdown formattin
     st.write(f"{len(results)} matches found:")    # Show the total number of perfumes found based on the applied filters
     # f"{len(results)} is an f-string used to insert a value inside a string dynamically
+    rows = results.rows    # Catalog row positions of the matches (a view, not a copy)
+
+    # Let the user choose the order and the number of perfumes per page
+    col_sort, col_size = st.columns([2, 1])
+    with col_sort:
+        sort_label = st.selectbox("Sort by", list(SORT_OPTIONS), key="results_sort")
+    with col_size:
+        page_size = st.selectbox("Per page", PAGE_SIZES, key="results_page_size")
+    pages = max(1, -(-len(rows) // page_size))    # Number of pages (rounded up)
+    # Go back to the first page whenever the matches, the order or the page size change
+    signature = (len(rows), int(rows[0]) if len(rows) else -1, int(rows[-1]) if len(rows) else -1, sort_label, page_size)
+    if st.session_state.get("results_signature") != signature:
+        st.session_state["results_signature"] = signature
+        st.session_state["results_page"] = 1
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key="results_page")
 
-    # Loop through each perfume in the results list
-    for idx, p in enumerate(results):    # 'idx' is the index used so that each perfume's buttons, interactions, and saved state are kept separate and uniquely identified in your loop
+    # Sort and slice on the row positions first, so only the perfumes of this page are read and turned into widgets
+    with span("page_rows"):
+        page_perfumes = perfume_table.results(catalog.page(rows, SORT_OPTIONS[sort_label], page - 1, page_size))
+
+    # Loop through each perfume on this page
+    for p in page_perfumes:    # Each p is a PerfumeRecord; p.row is its position in the catalog and keys its buttons and saved state, so they stay with the perfume when the page or the filters change
+        row = p.row
         with st.container():    # Group the perfume display content in a Streamlit container for layout separation and visual clarity
             st.markdown(f"**{p.get('name')}** by {p.get('brand')}")    # Display the perfume's name in bold and the brand next to it
             # Display perfume attributes in a structured, inline markdown format including gender, scent direction, season, occasion, personality, and price:
@@ -201,14 +227,15 @@ def display_results(results):    # Takes in 'results', which is a list of perfum
             )
 
             # Find shops feature connected with API
-            button_key = f"find_shops_{idx}"    # Define a unique key for this perfume's shop-finding button so that each perfume is treated as a separate UI element (for tracking)
-            if st.button(f"Find Shops for {p.get('name')}"):    # A button that, when clicked, triggers a shop-finding function for the perfume
-                st.session_state[f'shops_{idx}'] = find_shops(p.get('name'))    # Call a function that searches for shops selling the perfume and store the result in session state
+            button_key = f"find_shops_{row}"    # Define a unique key for this perfume's shop-finding button so that each perfume is treated as a separate UI element (for tracking)
+            if st.button(f"Find Shops for {p.get('name')}", key=button_key):    # A button that, when clicked, triggers a shop-finding function for the perfume
+                with span("find_shops"):
+                    st.session_state[f'shops_{row}'] = find_shops_cached(p.get('name'))    # Look up the shops selling the perfume (answered from the shared shop cache when possible) and store the result in session state
                 # Session state is used so the result persists across app reruns
 
-            if f'shops_{idx}' in st.session_state:   # Check if shop results for this specific perfume (indexed by idx) are stored in session state
+            if f'shops_{row}' in st.session_state:   # Check if shop results for this specific perfume (keyed by its catalog row) are stored in session state
             # This would be True only if the "Find Shops" button was previously clicked
-                shops = st.session_state[f'shops_{idx}']    # Retrieve the shop list for this specific perfume from session state
+                shops = st.session_state[f'shops_{row}']    # Retrieve the shop list for this specific perfume from session state
                 if shops:    # If shops were found, show a green success message
                     st.success("Shops found nearby:")
                     for shop in shops:
@@ -219,7 +246,7 @@ def display_results(results):    # Takes in 'results', which is a list of perfum
             # Helps maintain a clean, structured layout in the app
             st.markdown("---")
             
-        similar_key = f"similar_{idx}"
+        similar_key = f"similar_{row}"
         if st.button(f"Show Similar Scents to {p.get('name')}", key=similar_key):
             similar_perfumes = get_similar_perfumes_tagmatch(p)
             if similar_perfumes:
@@ -228,22 +255,47 @@ def display_results(results):    # Takes in 'results', which is a list of perfum
                     st.markdown(f"- * {sim['name']}* by {sim['brand']} ({sim['scent_direction']})")
             else: 
                 st.info("No similar perfumes found.")
+    return page_perfumes    # Return the ResultSet of the perfumes shown on this page (used for the price chart)
 
 
 # Display price comparison chart
+@timed("price_chart")
 def display_price_chart(results):
-    df_chart = pd.DataFrame(results)    # Convert the list of result dictionaries into a pandas DataFrame (each perfume becomes a rom)
-    if not df_chart.empty and 'name' in df_chart.columns and 'price' in df_chart.columns:    # Check if the DataFrame is not empty and contains both 'name' and 'price' columns
-    # This ensures that the chart is only generated if valid data is available
-        df_chart = df_chart[['name', 'price']].dropna().sort_values(by='price', ascending=False)    # Keep only the 'name' and 'price' columns for charting and sort in descending order
-        df_chart.columns = ['Perfume', 'Price']    # Rename the columns to more readable labels for the chart display
+    with span("price_chart_data"):
+        df_chart = price_chart_data(results)    # Keep the name and price of every perfume shown, sorted by price (descending), as 'Perfume' and 'Price' columns
+    if df_chart is not None:    # Only draw the chart if the results contain names and prices
         chart = alt.Chart(df_chart).mark_bar(cornerRadius=10).encode(    # Create a horizontal bar chart using Altair; encode() tells Altair how to map data columns to visual elements in the chart
             x='Price', # X-axis: price values
             y=alt.Y('Perfume', sort='-x'),    # Y-axis: perfume names (sorted by price descending using '-x')
             color=alt.value('#d27979'),    # Color: all bars use the same color
             tooltip=['Perfume', 'Price']    # Tooltip: shows perfume name and price on hover
         ).properties(title='Perfume Price Comparison')    # sets title to  tell users what the chart represents
-        st.altair_chart(chart, use_container_width=True)    # Render the chart in the Streamlit app, stretching it to the full container widt
+        with span("altair_chart"):
+            st.altair_chart(chart, use_container_width=True)    # Render the chart in the Streamlit app, stretching it to the full container widt
+
+# Debug panel (only shown in debug mode, see DEBUG above)
+def render_debug_panel(recorded):
+# Shows where the time of this rerun went, the work it did and (if switched on) its profile, with downloads for offline analysis
+    history = st.session_state.setdefault("debug_history", [])    # This session's last reruns (oldest first)
+    history.append(recorded)
+    del history[:-DEBUG_HISTORY]
+    with st.sidebar.expander("Debug", expanded=True):
+        st.checkbox("Profile the next reruns (cProfile)", key="debug_profile")    # Read at the top of the script, so it applies from the next rerun on
+        st.markdown(f"**Rerun:** {recorded.seconds * 1000:.1f} ms")
+        # One line per stage, indented under the stage it ran in, in the order the stages started
+        stages = sorted(recorded.spans, key=lambda s: s['start_ms'])
+        st.dataframe(
+            [{'stage': "· " * s['depth'] + s['name'], 'ms': s['ms'], 'start (ms)': s['start_ms']} for s in stages],
+            hide_index=True,
+        )
+        if recorded.counters:    # Rows scanned, API calls, cache hits, ...
+            st.markdown("  \n".join(f"*{name}:* {value:,}" for name, value in sorted(recorded.counters.items())))
+        if recorded.profile:
+            st.code(recorded.profile, language=None)
+        st.download_button("Download reruns (JSON lines)", instrumentation.to_json_lines(history),
+                           file_name="perfume_reruns.jsonl", mime="application/x-ndjson")
+        st.download_button("Download metrics (Prometheus)", instrumentation.prometheus_text(),
+                           file_name="perfume_metrics.prom", mime="text/plain")
 
 # Main application logic
 def main():        # is the core function that runs your app’s logic, deciding what content to show at each stage, based on the user’s actions
@@ -253,7 +305,7 @@ def main():        # is the core function that runs your app’s logic, deciding
         show_intro()       # Render the intro title, description, and images
         return             # Exit the function to prevent the rest of the app from running
 
-    filters = render_sidebar_filters(df)    # Render the sidebar filter UI and store the selected filter values
+    filters = render_sidebar_filters(catalog.options, catalog.facets)    # Render the sidebar filter UI and store the selected filter values
 
     # Initialize the session state flag to control whether results should be shown
     if "show_results" not in st.session_state:    
@@ -265,10 +317,10 @@ def main():        # is the core function that runs your app’s logic, deciding
 
     # If the "Show Results" button was clicked:
     if st.session_state.show_results:
-        result = filter_perfumes(df, filters)    # Apply the filter logic to the perfume dataset using the selected filters
-        if result:    # If matching perfumes are found, display them and show a price comparison chart
-            display_results(result)
-            display_price_chart(result)
+        result = filter_perfumes(df, filters, perfume_index, perfume_table)    # Apply the filter logic to the perfume dataset using the selected filters
+        if len(result):    # If matching perfumes are found, display the current page of them and a price comparison chart for that page
+            page_perfumes = display_results(result)
+            display_price_chart(page_perfumes)
         else:        # If no perfumes match the selected filters, display a warning message
             st.warning("No perfumes match your criteria.")
     else:        # If results haven't been requested yet, show an instructional layout with an image and guidance
@@ -287,6 +339,12 @@ def main():        # is the core function that runs your app’s logic, deciding
 # Ensure the main() function runs only when this script is executed directly
 # Prevents the app from running automatically if the file is imported as a module elsewhere
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:    # Also runs when a button restarts the script (st.rerun), so no recording is left open
+        if rerun_recording is not None:
+            instrumentation.finish_recording(rerun_recording)
+    if DEBUG:
+        render_debug_panel(rerun_recording)
 
 # ChatGPT was used as a supplementary tool during the development of this code
@@ -0,0 +1,147 @@
+# synthetic_catalog.py to generate perfume catalogs of any size with the schema and value distributions of Perfumes.csv
+#
+# Run it:   python synthetic_catalog.py --rows 100000 --seed 0 --out synthetic_100k.csv
+
+import argparse        # Import argparse to read the command-line options
+
+import numpy as np        # Import NumPy for the seeded, vectorized sampling
+import pandas as pd        # Import pandas to assemble and write the catalog
+
+# Value frequencies of the categorical columns as found in Perfumes.csv (value -> weight)
+GENDERS = {'Female': 56, 'Male': 44, 'Unisex': 35}
+SCENT_DIRECTIONS = {
+    'Floral': 24, 'Woody': 21, 'Spicy': 17, 'Sweet': 15, 'Citrus': 14, 'Fresh': 13, 'Fruity': 13,
+    'Powdery': 9, 'Aquatic': 5, 'Musk': 1, 'Chypre': 1, 'White Floral': 1, 'Amber': 1,
+}
+SEASONS = {'Spring': 38, 'Winter': 33, 'Summer': 32, 'Autumn': 27, 'All Year': 5}
+PERSONALITIES = {
+    'Sophisticated': 18, 'Playful': 16, 'Romantic': 16, 'Luxurious': 13, 'Relaxed': 13,
+    'Confident': 12, 'Mysterious': 12, 'Artistic': 12, 'Subtle': 12, 'Bold': 11,
+}
+OCCASIONS = {'Evening': 46, 'Daytime': 37, 'Formal': 18, 'Night Out': 11, 'Casual': 10, 'Office': 9, 'Romantic': 4}
+PRICES = {'Mid': 73, 'High': 55, 'Low': 7}
+
+BRANDS = [
+    "Prada", "Chanel", "Armani", "Dior", "Dolce & Gabbana", "Tom Ford", "Givenchy", "Versace", "Jean Paul Gaultier",
+    "Maison Francis Kurkdjian", "Frederic Malle", "Burberry", "Maison Margiela", "Yves Saint Laurent", "Lancôme",
+    "Parfums de Marly", "Carolina Herrera", "Paco Rabanne", "Guerlain", "Creed", "Le Labo", "Viktor & Rolf", "Hermès",
+    "Byredo", "Jo Malone", "Diptyque", "Bvlgari", "Hugo Boss", "Issey Miyake", "Mancera", "Marc Jacobs", "Kilian",
+    "Mugler", "Narciso Rodriguez", "Amouage", "Chloé", "Lacoste", "Montale", "Xerjoff", "Acqua di Parma", "Gucci",
+]
+BASE_NOTES = [
+    "pear", "musk", "grapefruit", "rose", "cardamom", "bergamot", "lavender", "sage", "mint", "violet", "sandalwood",
+    "vanilla", "amber", "pepper", "tuberose", "cedarwood", "tonka bean", "patchouli", "mandarin", "lemon", "jasmine",
+    "iris", "oud", "vetiver", "leather", "incense", "neroli", "orange blossom", "ylang-ylang", "saffron", "cinnamon",
+    "ginger", "coconut", "peach", "blackcurrant", "raspberry", "fig", "heliotrope", "lily", "magnolia", "benzoin",
+    "labdanum", "oakmoss", "tobacco", "coffee", "caramel", "almond", "rum", "pink pepper", "juniper",
+]
+NOTE_QUALIFIERS = ["", "white", "black", "wild", "sweet", "green", "smoked", "bitter", "sicilian", "madagascar"]
+NAME_WORDS = [
+    "Bleu", "Noir", "Rouge", "Blanc", "Or", "Eau", "Nuit", "Soleil", "Velvet", "Amber", "Oud", "Rose", "Santal",
+    "Vetiver", "Iris", "Musc", "Cuir", "Ambre", "Fleur", "Jardin", "Bois", "Ciel", "Lune", "Étoile", "Orage", "Brise",
+    "Mirage", "Désir", "Secret", "Éclat", "Silk", "Smoke", "Tobacco", "Honey", "Citrus", "Vanille", "Tonka", "Néroli",
+    "Myrrhe", "Encens", "Aqua", "Sport", "Storm", "Dream", "Wild", "Royal", "Infinite", "Pure", "Divine", "Golden",
+]
+FLANKERS = ["", " Intense", " Eau de Toilette", " Parfum", " Extrême", " Absolu", " Night", " Sport", " Elixir", " Privé"]
+
+
+def _weights(count, exponent, rng=None):
+    # Zipf-like popularity (a few brands or notes are very common, most are rare), optionally in a random order
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    if rng is not None:
+        weights = weights[rng.permutation(count)]
+    return weights / weights.sum()
+
+
+def _pick(rng, frequencies, rows):
+    values = np.array(list(frequencies), dtype=object)
+    weights = np.array(list(frequencies.values()), dtype=float)
+    return values[rng.choice(len(values), size=rows, p=weights / weights.sum())]
+
+
+def note_vocabulary():
+    """Returns the note vocabulary of the synthetic catalogs (500 notes, the real ones first)."""
+    return [f"{qualifier} {note}".strip() for qualifier in NOTE_QUALIFIERS for note in BASE_NOTES]
+
+
+def brand_vocabulary(rows):
+    """Returns the brands of a catalog with `rows` perfumes (about one brand per 500 perfumes, at least the real ones)."""
+    count = max(len(BRANDS), min(rows // 500, 5000))
+    return BRANDS + [f"Maison {NAME_WORDS[i % len(NAME_WORDS)]} {i // len(NAME_WORDS) + 1}" for i in range(count - len(BRANDS))]
+
+
+def _notes(rng, vocabulary, weights, rows, per_row):
+    # `per_row` distinct notes per perfume, joined like the CSV ("pear, musk, rose")
+    picks = rng.choice(len(vocabulary), size=(rows, per_row), p=weights)
+    for _ in range(100):        # Redraw the notes repeated within a perfume (rare, so this converges quickly)
+        repeated = np.zeros(rows, dtype=bool)
+        for a in range(per_row):
+            for b in range(a + 1, per_row):
+                repeated |= picks[:, a] == picks[:, b]
+        if not repeated.any():
+            break
+        picks[repeated] = rng.choice(len(vocabulary), size=(int(repeated.sum()), per_row), p=weights)
+    names = np.array(vocabulary, dtype=object)
+    cells = names[picks[:, 0]]
+    for i in range(1, per_row):
+        cells = cells + ", " + names[picks[:, i]]
+    return cells
+
+
+def generate_catalog(rows, seed=0, missing=0.005):
+    """
+    Generates a synthetic perfume catalog.
+
+    The columns and their categorical values follow Perfumes.csv (with its value
+    frequencies); brands and notes follow a Zipf-like popularity over a vocabulary that
+    grows with the catalog. The same rows and seed always give the same catalog.
+
+    Args:
+        rows (int): Number of perfumes.
+        seed (int): Seed of the random generator.
+        missing (float): Share of empty cells in the attribute columns (real feeds have gaps).
+
+    Returns:
+        pd.DataFrame: The catalog, with the columns of Perfumes.csv.
+    """
+    rng = np.random.default_rng(seed)
+    brands = np.array(brand_vocabulary(rows), dtype=object)
+    words = np.array(NAME_WORDS, dtype=object)
+    flankers = np.array(FLANKERS, dtype=object)
+    name = (words[rng.integers(len(words), size=rows)] + " " + words[rng.integers(len(words), size=rows)]
+            + flankers[rng.choice(len(flankers), size=rows, p=_weights(len(flankers), 1.0))])
+    vocabulary = note_vocabulary()
+    df = pd.DataFrame({
+        'name': name,
+        'brand': brands[rng.choice(len(brands), size=rows, p=_weights(len(brands), 1.1))],
+        'gender': _pick(rng, GENDERS, rows),
+        'scent_direction': _pick(rng, SCENT_DIRECTIONS, rows),
+        # Every tier has its own popular notes (a random order of the same Zipf weights)
+        'top_notes': _notes(rng, vocabulary, _weights(len(vocabulary), 0.9, rng), rows, 3),
+        'middle_notes': _notes(rng, vocabulary, _weights(len(vocabulary), 0.9, rng), rows, 3),
+        'base_notes': _notes(rng, vocabulary, _weights(len(vocabulary), 0.9, rng), rows, 3),
+        'season': _pick(rng, SEASONS, rows),
+        'personality': _pick(rng, PERSONALITIES, rows),
+        'occasion': _pick(rng, OCCASIONS, rows),
+        'price': _pick(rng, PRICES, rows),
+    })
+    if missing > 0:
+        for column in ('scent_direction', 'season', 'personality', 'occasion', 'price'):
+            df.loc[rng.random(rows) < missing, column] = None
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic perfume catalog CSV.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--missing", type=float, default=0.005, help="share of empty attribute cells")
+    parser.add_argument("--out", default=None, help="output CSV (default synthetic_<rows>.csv)")
+    args = parser.parse_args()
+    out = args.out or f"synthetic_{args.rows}.csv"
+    generate_catalog(args.rows, args.seed, args.missing).to_csv(out, sep=";", index=False, encoding="utf-8")
+    print(f"Wrote {args.rows} perfumes to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# test_api_server.py to check the validation and batch errors of the JSON API against a server running in this process
+
+import http.client        # Import http.client to send raw requests (including broken ones)
+import json        # Import json to build the bodies and read the answers
+import threading        # Import threading to run the server next to the tests
+from http.server import ThreadingHTTPServer        # Import the server class api_server uses
+from urllib.parse import quote        # Import quote for names in the path
+
+import pytest        # Import pytest for the fixtures and the parametrization
+
+import api_server
+from api_server import MAX_BATCH, MAX_PAGE_SIZE, ApiHandler
+from catalog import Catalog
+from filter_index import ALL, FILTER_COLUMNS
+from synthetic_catalog import generate_catalog
+
+ROWS = 200        # Perfumes in the served catalog
+
+
+@pytest.fixture(scope="module")
+def server():
+    catalog = Catalog(generate_catalog(ROWS, seed=5, missing=0.05))
+    previous, api_server.catalog = api_server.catalog, catalog
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ApiHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    api_server.catalog = previous
+
+
+def _request(server, method, path, body=None, headers=None):
+    # One request on a fresh connection; returns (status, decoded JSON answer)
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+    try:
+        data = body if body is None or isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        connection.request(method, path, body=data, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_filter_answers_like_the_catalog(server):
+    catalog = api_server.catalog
+    gender = catalog.options['gender'][0]
+    status, answer = _request(server, "GET", f"/filter?gender={quote(gender)}&page=1&page_size=5&sort=-price")
+    rows = catalog.filter_index.query({key: gender if key == 'gender' else ALL for key in FILTER_COLUMNS})
+    assert status == 200 and answer['total'] == len(rows)
+    assert answer['results'] == catalog.records(catalog.page(rows, ('price', True), 1, 5))
+
+
+@pytest.mark.parametrize("query", [
+    "page=-1", "page=two", f"page_size={MAX_PAGE_SIZE + 1}", "page_size=0", "sort=brand",
+])
+def test_invalid_filter_queries(server, query):
+    status, answer = _request(server, "GET", f"/filter?{query}")
+    assert status == 400 and answer['error']
+
+
+def test_filter_batch_errors_stay_per_item(server):
+    gender = api_server.catalog.options['gender'][0]
+    queries = [{'filters': {'gender': gender}}, {'filters': {'gender': ["Female"]}}, "not a query",
+               {'filters': {'colour': "Red"}}, {'page_size': 5}]
+    status, answer = _request(server, "POST", "/filter", {'queries': queries})
+    assert status == 200
+    results = answer['results']
+    assert [result.get('status') for result in results] == [None, 400, 400, 400, None]
+    assert len(results[4]['results']) == 5
+    for queries in ([], "all", [{}] * (MAX_BATCH + 1)):        # The batch itself is checked as a whole
+        status, answer = _request(server, "POST", "/filter", {'queries': queries})
+        assert status == 400 and answer['error']
+
+
+def test_similar(server):
+    catalog = api_server.catalog
+    name = catalog.df['name'].iloc[0]
+    status, answer = _request(server, "GET", f"/similar/{quote(name)}?k=2")
+    assert status == 200 and answer['similar'] == catalog.records(catalog.similarity.similar_to_row(catalog.find(name), 2))
+    status, answer = _request(server, "POST", "/similar", {'names': [name, "Not In Catalog", 7], 'k': 2})
+    assert status == 200
+    assert [result.get('status') for result in answer['results']] == [None, 404, 400]
+    assert _request(server, "GET", f"/similar/{quote(name)}?k=0")[0] == 400
+    assert _request(server, "GET", "/similar")[0] == 400        # No name
+    assert _request(server, "GET", f"/similarity/{quote(name)}")[0] == 404        # Only /similar and /similar/... are routed
+
+
+def test_shops_batch_errors_stay_per_item(server, monkeypatch):
+    monkeypatch.setattr(api_server, "find_shops_many", lambda names, location: {name: [] for name in names})
+    status, answer = _request(server, "POST", "/shops", {'names': ["Sauvage", 3], 'location': "Bern"})
+    assert status == 200 and answer['location'] == "Bern"
+    assert answer['results'] == [{'name': "Sauvage", 'shops': []},
+                                 {'name': 3, 'error': "name must be a string", 'status': 400}]
+    assert _request(server, "POST", "/shops", {'names': ["Sauvage"], 'location': 3})[0] == 400
+    assert _request(server, "GET", "/shops")[0] == 400        # No name
+
+
+@pytest.mark.parametrize("body, headers", [
+    (b"{not json", {}),
+    (b"[1, 2]", {}),        # Not an object
+    (b"{}", {'Content-Length': "two"}),
+    (b"{}", {'Content-Length': "-1"}),
+])
+def test_invalid_bodies(server, body, headers):
+    status, answer = _request(server, "POST", "/filter", body, headers)
+    assert status == 400 and answer['error']
+
+
+def test_unknown_endpoint(server):
+    assert _request(server, "GET", "/perfumes")[0] == 404
+    assert _request(server, "GET", "/health")[1]['perfumes'] == ROWS
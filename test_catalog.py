@@ -0,0 +1,133 @@
+# test_catalog.py to check the snapshot reuse of read_catalog_frame() and the sorted result pages of Catalog.page()
+
+import json        # Import json to inspect and damage the snapshot metadata
+import os        # Import os for the file timestamps and the snapshot files
+
+import numpy as np        # Import NumPy for the seeded random result lists
+import pytest        # Import pytest for the parametrization
+
+from catalog import PRICE_ORDER, SORT_OPTIONS, Catalog, read_catalog_frame, snapshot_folder
+from instrumentation import recording
+from synthetic_catalog import generate_catalog
+
+ROWS = 60        # Perfumes in the test CSV
+PAGE_SIZE = 10        # Perfumes per result page in the page tests
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "catalog.csv"
+    generate_catalog(ROWS, seed=3, missing=0.1).to_csv(path, sep=";", index=False, encoding="utf-8")
+    return str(path)
+
+
+def _load(path, values):
+    # The frame as plain Python columns, and whether it came from the snapshot or from the CSV
+    with recording("test") as rec:
+        df = read_catalog_frame(path, "snapshots")
+    assert rec.counters.get("catalog_snapshot_loads", 0) + rec.counters.get("catalog_csv_parses", 0) == 1
+    source = "snapshot" if rec.counters.get("catalog_snapshot_loads") else "csv"
+    return {column: values(df, column) for column in df.columns}, source
+
+
+def _meta(path):
+    with open(os.path.join(snapshot_folder(path, "snapshots"), "meta.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _move_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5_000_000_000))
+
+
+def test_unchanged_csv_reuses_the_snapshot(csv_path, values):
+    first, source = _load(csv_path, values)
+    assert source == "csv"
+    again, source = _load(csv_path, values)
+    assert source == "snapshot" and again == first
+
+
+def test_changed_contents_rebuild(csv_path, values):
+    before, _ = _load(csv_path, values)
+    with open(csv_path, encoding="utf-8") as f:
+        text = f.read()
+    name = before['name'][0]
+    with open(csv_path, "w", encoding="utf-8") as f:        # Same size, other contents
+        f.write(text.replace(name, name[::-1], 1))
+    _move_mtime(csv_path)
+    after, source = _load(csv_path, values)
+    assert source == "csv" and after['name'][0] == name[::-1]
+    folder = snapshot_folder(csv_path, "snapshots")
+    meta = _meta(csv_path)
+    assert sorted(name for name in os.listdir(folder) if name.startswith(("codes-", "dictionary-"))) == \
+        sorted(meta['codes_files'] + [meta['dictionary_file']])        # Files of the old version are gone
+    assert _load(csv_path, values) == (after, "snapshot")
+
+
+def test_touched_csv_keeps_the_snapshot(csv_path, values):
+    before, _ = _load(csv_path, values)
+    _move_mtime(csv_path)        # E.g. a fresh checkout: new timestamp, same contents (the hash decides)
+    after, source = _load(csv_path, values)
+    assert source == "snapshot" and after == before
+    assert _meta(csv_path)['source']['mtime_ns'] == os.stat(csv_path).st_mtime_ns        # So the next load skips the hash
+
+
+@pytest.mark.parametrize("damage", ["meta", "version", "codes", "dictionary"])
+def test_broken_snapshot_falls_back_to_the_csv(csv_path, values, damage):
+    before, _ = _load(csv_path, values)
+    folder = snapshot_folder(csv_path, "snapshots")
+    meta = _meta(csv_path)
+    if damage == "meta":
+        with open(os.path.join(folder, "meta.json"), "w", encoding="utf-8") as f:
+            f.write("{not json")
+    elif damage == "version":
+        with open(os.path.join(folder, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(meta, version=meta['version'] - 1), f)
+    elif damage == "codes":
+        os.remove(os.path.join(folder, meta['codes_files'][0]))
+    else:
+        with open(os.path.join(folder, meta['dictionary_file']), "w", encoding="utf-8") as f:
+            f.write('{"name": [')
+    after, source = _load(csv_path, values)
+    assert source == "csv" and after == before
+    assert _load(csv_path, values) == (before, "snapshot")        # The snapshot was written again
+
+
+def _brute_sorted(column_values, rows, sort):
+    # Full sort: values in order (price levels by PRICE_ORDER), missing values last, ties in catalog order
+    if sort is None:
+        return list(rows)
+    column, descending = sort
+    present = {value for value in column_values if value is not None}
+    if column == 'price':
+        ordered = sorted(present, key=lambda v: (PRICE_ORDER.index(v) if v in PRICE_ORDER else len(PRICE_ORDER), str(v)))
+    else:
+        ordered = sorted(present, key=str)
+    if descending:
+        ordered.reverse()
+    rank = {value: i for i, value in enumerate(ordered)}
+    return sorted(rows, key=lambda row: (rank.get(column_values[row], len(ordered)), row))
+
+
+@pytest.mark.parametrize("sort", list(SORT_OPTIONS.values()))
+def test_pages_match_a_full_sort(df, values, sort):
+    catalog = Catalog(df)
+    column_values = values(df, sort[0]) if sort else None
+    rng = np.random.default_rng(6)
+    for size in (0, 1, PAGE_SIZE, 37, len(df)):
+        rows = np.sort(rng.choice(len(df), size=size, replace=False)).astype(np.int64)        # Matches come in catalog order
+        expected = _brute_sorted(column_values, rows.tolist(), sort)
+        pages = -(-size // PAGE_SIZE)
+        for page in range(pages + 1):        # The page after the last one is empty
+            found = catalog.page(rows, sort, page, PAGE_SIZE)
+            assert found.tolist() == expected[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+        assert catalog.page(rows, sort, 0, max(size, 1)).tolist() == expected        # One page holding every match
+
+
+def test_sort_keys_are_built_once(df):
+    catalog = Catalog(df)
+    rows = np.arange(len(df), dtype=np.int64)
+    catalog.page(rows, ('price', True), 0, PAGE_SIZE)
+    key = catalog.sort_key('price', True)
+    catalog.page(rows, ('price', True), 1, PAGE_SIZE)
+    assert catalog.sort_key('price', True) is key and list(catalog._sort_keys) == [('price', True)]
@@ -0,0 +1,50 @@
+# test_facets.py to check FacetEngine against plain Python counts over small seeded catalogs
+
+import numpy as np        # Import NumPy for the seeded random selections
+
+from facets import FacetEngine
+from filter_index import ALL, FILTER_COLUMNS, FilterIndex
+
+QUERIES = 60        # Random selections checked per catalog
+
+
+def _brute_counts(filter_values, filters, key, values):
+    # Perfumes left by every other filter, and how many of them have each value of this one
+    others = [row for row in range(len(filter_values[key])) if all(
+        value == ALL or filter_values[other][row] == value for other, value in filters.items() if other != key)]
+    return len(others), [sum(1 for row in others if filter_values[key][row] == value) for value in values]
+
+
+def test_counts(df, filter_values, filters_for):
+    index = FilterIndex(df)
+    facets = FacetEngine(index)
+    rng = np.random.default_rng(2)
+    for _ in range(QUERIES):
+        filters = filters_for(df, rng)
+        counts = facets.counts(filters)
+        for key in FILTER_COLUMNS:
+            matching, per_code = counts[key]
+            assert (matching, per_code.tolist()) == _brute_counts(filter_values, filters, key, index.categories[key])
+
+
+def test_counts_without_selection(df, filter_values):
+    index = FilterIndex(df)
+    counts = FacetEngine(index).counts({})
+    for key in FILTER_COLUMNS:
+        matching, per_code = counts[key]
+        assert matching == len(df)
+        assert per_code.tolist() == [filter_values[key].count(value) for value in index.categories[key]]
+
+
+def test_options(df, filter_values, filters_for):
+    index = FilterIndex(df)
+    facets = FacetEngine(index)
+    rng = np.random.default_rng(5)
+    for _ in range(10):
+        filters = filters_for(df, rng)
+        shown = {key: index.categories[key][:5] + ["Not In Catalog"] for key in FILTER_COLUMNS}
+        options = facets.options(filters, shown)
+        for key, values in shown.items():
+            matching, counts = _brute_counts(filter_values, filters, key, values)
+            assert list(options[key]) == [ALL] + values        # Display order is kept
+            assert [options[key][ALL]] + [options[key][value] for value in values] == [matching] + counts
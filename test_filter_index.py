@@ -0,0 +1,52 @@
+# test_filter_index.py to check FilterIndex against a plain Python loop over small seeded catalogs
+
+import numpy as np        # Import NumPy for the seeded random queries
+
+from filter_index import ALL, BITMAP_VALUES, FILTER_COLUMNS, FilterIndex
+
+QUERIES = 60        # Random selections checked per catalog
+
+
+def _brute_query(filter_values, filters):
+    # The rows whose value equals every selected value (a missing value matches nothing)
+    size = len(filter_values['brand'])
+    return [row for row in range(size)
+            if all(value == ALL or filter_values[key][row] == value for key, value in filters.items())]
+
+
+def test_query(df, filter_values, filters_for):
+    index = FilterIndex(df)
+    rng = np.random.default_rng(1)
+    for _ in range(QUERIES):
+        filters = filters_for(df, rng)
+        assert index.query(filters).tolist() == _brute_query(filter_values, filters)
+
+
+def test_query_without_large_filters(df, filter_values, filters_for):
+    # Selections without a brand take the bitmap path only
+    index = FilterIndex(df)
+    rng = np.random.default_rng(4)
+    for _ in range(QUERIES):
+        filters = dict(filters_for(df, rng), brand=ALL)
+        assert index.query(filters).tolist() == _brute_query(filter_values, filters)
+    assert index.query({key: ALL for key in FILTER_COLUMNS}).tolist() == list(range(len(df)))
+
+
+def test_large_filters_keep_row_lists(df, filter_values):
+    index = FilterIndex(df)
+    assert len(index.categories['brand']) > BITMAP_VALUES        # The seeded catalog has enough brands to use the row lists
+    assert 'brand' in index.postings and 'brand' not in index.matrices
+    assert all(len(index.categories[key]) <= BITMAP_VALUES for key in index.matrices)
+    for brand in index.categories['brand'][:10]:
+        expected = [row for row, value in enumerate(filter_values['brand']) if value == brand]
+        assert index.rows('brand', brand).tolist() == expected
+        assert np.flatnonzero(index.mask(index.bitmap('brand', brand))).tolist() == expected
+    assert len(index.rows('brand', "Not In Catalog")) == 0
+    assert not index.bitmap('brand', "Not In Catalog").any()
+
+
+def test_codes_are_not_copied(df):
+    index = FilterIndex(df)
+    for key, column in FILTER_COLUMNS.items():
+        if hasattr(df[column], 'cat'):
+            assert np.shares_memory(index.codes[key], df[column].array.codes)
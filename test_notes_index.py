@@ -0,0 +1,88 @@
+# test_notes_index.py to check NotesIndex against plain Python note sets and cosine scores over small seeded catalogs
+
+import math        # Import math for the plain Python idf and norms
+
+import numpy as np        # Import NumPy for the seeded random queries
+import pytest        # Import pytest for the parametrization and approximate scores
+
+from notes_index import TIER_WEIGHTS, NotesIndex, normalize_note
+
+K = 5        # Similar perfumes per query
+
+
+def _profiles(df, values, tfidf):
+    # Note -> weight per perfume (summed over the tiers), scaled by the idf if asked, then unit length
+    profiles = []
+    for row in range(len(df)):
+        profile = {}
+        for column, weight in TIER_WEIGHTS.items():
+            cell = values(df, column)[row]
+            for note in ([] if cell is None else str(cell).split(",")):
+                if note.strip():
+                    profile[normalize_note(note)] = profile.get(normalize_note(note), 0.0) + weight
+        profiles.append(profile)
+    frequency = {}
+    for profile in profiles:
+        for note in profile:
+            frequency[note] = frequency.get(note, 0) + 1
+    idf = {note: math.log((1 + len(df)) / (1 + count)) + 1.0 for note, count in frequency.items()}
+    for profile in profiles:
+        if tfidf:
+            profile.update((note, weight * idf[note]) for note, weight in profile.items())
+        norm = math.sqrt(sum(weight ** 2 for weight in profile.values()))
+        profile.update((note, weight / norm) for note, weight in profile.items())
+    return profiles, idf
+
+
+def _brute_similar(profiles, query, k, itself=None):
+    scored = [(-round(score, 9), row, score) for row, profile in enumerate(profiles) if row != itself
+              for score in [sum(weight * profile.get(note, 0.0) for note, weight in query.items())] if score > 0]
+    return [(row, score) for _, row, score in sorted(scored)[:k]]
+
+
+def _queries(index, rng, count=40):
+    # One to three notes: rare and common ones from the vocabulary, sometimes in another spelling or unknown
+    queries = []
+    for _ in range(count):
+        notes = [index.vocabulary[i] for i in rng.integers(len(index.vocabulary), size=rng.integers(1, 4))]
+        if rng.random() < 0.2:
+            notes[0] = f"  {notes[0].title()} "
+        if rng.random() < 0.1:
+            notes.append("not a note")
+        queries.append(notes)
+    return queries
+
+
+def test_containing(df, values):
+    index = NotesIndex(df)
+    profiles, _ = _profiles(df, values, tfidf=False)
+    rng = np.random.default_rng(8)
+    for notes in _queries(index, rng) + [[note] for note in index.vocabulary[:20]]:
+        wanted = {normalize_note(note) for note in notes}
+        assert index.containing(notes, "all").tolist() == [
+            row for row, profile in enumerate(profiles) if wanted <= profile.keys()]
+        assert index.containing(notes, "any").tolist() == [
+            row for row, profile in enumerate(profiles) if wanted & profile.keys()]
+    assert len(index.containing([])) == 0
+    with pytest.raises(ValueError):
+        index.containing(["vanilla"], "some")
+
+
+@pytest.mark.parametrize("tfidf", [False, True])
+def test_similar(df, values, tfidf):
+    index = NotesIndex(df, tfidf=tfidf)
+    profiles, idf = _profiles(df, values, tfidf)
+    for row in range(0, len(df), 7):
+        found = index.similar(row, K)
+        expected = _brute_similar(profiles, profiles[row], K, itself=row)
+        assert [r for r, _ in found] == [r for r, _ in expected]
+        assert [s for _, s in found] == pytest.approx([s for _, s in expected])
+    rng = np.random.default_rng(9)
+    for notes in _queries(index, rng):
+        known = {normalize_note(note) for note in notes} & idf.keys()
+        query = {note: idf[note] if tfidf else 1.0 for note in known}
+        norm = math.sqrt(sum(weight ** 2 for weight in query.values()))
+        expected = _brute_similar(profiles, {note: weight / norm for note, weight in query.items()}, K)
+        found = index.similar(notes, K)
+        assert [r for r, _ in found] == [r for r, _ in expected]
+        assert [s for _, s in found] == pytest.approx([s for _, s in expected])
@@ -0,0 +1,62 @@
+# test_profile_match.py to check ProfileMatcher against a plain Python ranking over small seeded catalogs
+
+import numpy as np        # Import NumPy for the seeded random profiles
+import pytest        # Import pytest for the parametrization
+
+from filter_index import ALL, FILTER_COLUMNS, FilterIndex
+from profile_match import NO_PREFERENCE, ProfileMatcher
+from similarity import UNKNOWN
+
+PROFILES = 80        # Random profiles checked per catalog
+
+
+def _brute_match(filter_values, profile, required, top_n):
+    # Score every perfume by the sidebar filters it matches (missing values never match), skip those failing a required one
+    preferences = {key: value for key, value in profile.items() if value != ALL}
+    scored = []
+    for row in range(len(filter_values['brand'])):
+        hits = {key for key, value in preferences.items() if filter_values[key][row] == value}
+        if all(key in hits for key in preferences if key in required):
+            scored.append((-len(hits), row))
+    ranked = sorted(scored)[:top_n]
+    return [row for _, row in ranked], [-score for score, _ in ranked]
+
+
+@pytest.mark.parametrize("required, top_n", [((), 10), (('gender',), 5), (('brand', 'price'), 3)])
+def test_match(df, filter_values, filters_for, required, top_n):
+    index = FilterIndex(df)
+    matcher = ProfileMatcher(index, top_n, required)
+    rng = np.random.default_rng(4)
+    profiles = [filters_for(df, rng) for _ in range(PROFILES)]
+    profiles += profiles[:10]        # Repeated profiles come from the cache
+    results = matcher.match(np.stack([matcher.encode(profile) for profile in profiles]))
+    for profile, (rows, scores) in zip(profiles, results):
+        assert (rows.tolist(), scores.tolist()) == _brute_match(filter_values, profile, required, top_n)
+        # Required filters mean exactly what the sidebar means
+        assert np.isin(rows, index.query({key: profile[key] for key in required})).all()
+
+
+def test_every_filter_scores(df, filter_values):
+    # A profile is a set of sidebar choices: all seven filters count, not only the four tags of the similarity
+    matcher = ProfileMatcher(FilterIndex(df), top_n=1)
+    row = next(row for row in range(len(df)) if all(filter_values[key][row] is not None for key in FILTER_COLUMNS))
+    profile = {key: filter_values[key][row] for key in FILTER_COLUMNS}
+    (rows, scores), = matcher.match(matcher.encode(profile))
+    assert scores.tolist() == [len(FILTER_COLUMNS)] and filter_values['brand'][rows[0]] == profile['brand']
+
+
+def test_values_match_exactly(df, filter_values):
+    index = FilterIndex(df)
+    matcher = ProfileMatcher(index, top_n=5, required=('gender',))
+    gender = filter_values['gender'][0]
+    scent = index.columns['scent']
+    codes = matcher.encode({' GENDER ': gender, scent: ALL, 'season': "", 'price': None, 'colour': "Red"})
+    assert codes.tolist() == [NO_PREFERENCE, index.lookup['gender'][gender]] + [NO_PREFERENCE] * 5
+    assert matcher.encode({'gender': gender.upper()})[1] == UNKNOWN        # Values are not case-folded, like the sidebar
+    (rows, _), = matcher.match(matcher.encode({'gender': gender.upper()}))
+    assert len(rows) == 0 and len(index.query({'gender': gender.upper()})) == 0
+
+
+def test_unknown_required_filter(df):
+    with pytest.raises(ValueError):
+        ProfileMatcher(FilterIndex(df), required=('colour',))
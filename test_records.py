@@ -0,0 +1,75 @@
+# test_records.py to check that CatalogTable, PerfumeRecord and ResultSet read exactly what the DataFrame holds
+
+import numpy as np        # Import NumPy for the row positions
+import pytest        # Import pytest for the parametrization
+
+import records
+from records import CatalogTable, PerfumeRecord, ResultSet
+
+
+@pytest.fixture(params=["list", "index"])
+def table(request, df, monkeypatch):
+    # Small dictionaries are decoded through a list, large ones through the pd.Index; check both ways on every column
+    if request.param == "index":
+        monkeypatch.setattr(records, "DECODED_VALUES", 0)
+    return CatalogTable(df)
+
+
+def test_records_read_the_frame(df, values, table):
+    rows = list(range(0, len(df), 9))
+    for column in df.columns:
+        expected = values(df, column)
+        assert [table.record(row)[column] for row in rows] == [expected[row] for row in rows]
+        assert table.column(column, np.array(rows)) == [expected[row] for row in rows]
+    perfume = table.record(3)
+    assert perfume.to_dict() == {column: values(df, column)[3] for column in df.columns}
+    assert list(perfume) == list(df.columns) and len(perfume) == len(df.columns)
+    assert 'brand' in perfume and 'scent' not in perfume
+    with pytest.raises(KeyError):
+        perfume['scent']        # Like a dict: unknown fields raise, get() gives the default
+    assert perfume.get('scent', "-") == "-"
+
+
+def test_missing_values(df, values, table):
+    prices = values(df, 'price')
+    row = prices.index(None)
+    assert table.record(row)['price'] is None
+    assert table.record(row).get('price', "n/a") == "n/a"
+
+
+def test_records_compare_by_row(table):
+    assert table.record(5) == PerfumeRecord(table, np.int64(5))
+    assert table.record(5) != table.record(6)
+    assert len({table.record(5), table.record(5), table.record(6)}) == 2
+
+
+def test_result_sets_are_views(df, values, table):
+    rows = np.array([7, 3, 250, 3, 99], dtype=np.int64)
+    results = table.results(rows)
+    assert results.rows is rows        # No copy of the row positions
+    page = results[1:4]
+    assert isinstance(page, ResultSet) and np.shares_memory(page.rows, rows)
+    assert [p.row for p in page] == [3, 250, 3]
+    assert results[2].row == 250 and len(results) == 5
+    assert [p.row for p in results.take(np.array([4, 0]))] == [99, 7]
+    names = values(df, 'name')
+    assert results.column('name') == [names[row] for row in rows]
+    assert results.to_dicts() == [table.record(row).to_dict() for row in rows]
+
+
+def test_to_frame(df, values, table):
+    rows = np.array([10, 2, 300], dtype=np.int64)
+    frame = table.results(rows).to_frame(['brand', 'price'])
+    assert list(frame.index) == [10, 2, 300] and frame.index.name == 'row'
+    for column in ('brand', 'price'):
+        expected = [values(df, column)[row] for row in rows]
+        assert [None if value != value else value for value in frame[column].astype(object)] == expected
+
+
+def test_codes_are_shared_with_the_frame(df):
+    table = CatalogTable(df)
+    for column in df.columns:
+        if hasattr(df[column], 'cat'):        # Categorical frame: the table points at the frame's own codes and dictionary
+            assert np.shares_memory(table.codes[column], df[column].array.codes)
+            assert table.categories[column] is df[column].cat.categories
+    assert table.nbytes == sum(codes.nbytes for codes in table.codes.values())
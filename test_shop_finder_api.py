@@ -0,0 +1,128 @@
+# test_shop_finder_api.py to check the shop cache: coalesced lookups, freshness, stale-while-revalidate and the disk tier
+
+import threading        # Import threading to run concurrent lookups
+import time        # Import time to wait for the background refresh
+import types        # Import types for the fake clock module
+
+import pytest        # Import pytest for the fixtures
+
+import shop_finder_api
+from shop_finder_api import ShopCache, ShopLookupError
+
+TTL = 100.0        # Seconds an entry is fresh (on the fake clock)
+STALE = 50.0        # Seconds after that it is served while refreshing
+WAIT = 5.0        # Longest real wait for another thread
+
+
+class FakeFetch:
+    """Stand-in for fetch_shops: counts its calls and answers with the call number in the shop name."""
+
+    def __init__(self, gate=None, fail=False):
+        self.calls = 0
+        self.gate = gate        # Event the lookup waits for (to keep it running while others arrive)
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def __call__(self, perfume_name, location, **options):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if self.gate is not None:
+            assert self.gate.wait(WAIT)
+        if self.fail:
+            raise ShopLookupError("upstream down")
+        return [{'name': f"{perfume_name} shop {call}", 'address': location}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # The cache reads time.time() for the age of its entries; everything else keeps the real clock
+    now = [1_000_000.0]
+    monkeypatch.setattr(shop_finder_api, "time", types.SimpleNamespace(
+        time=lambda: now[0], monotonic=time.monotonic, sleep=time.sleep))
+    return now
+
+
+def _wait_for(condition):
+    stop = time.monotonic() + WAIT
+    while not condition():
+        assert time.monotonic() < stop, "timed out"
+        time.sleep(0.005)
+
+
+def test_concurrent_lookups_are_coalesced(tmp_path):
+    fetch = FakeFetch(gate=threading.Event())
+    cache = ShopCache(str(tmp_path / "shops.sqlite3"), ttl=TTL, stale=STALE, fetch=fetch)
+    names = ["Sauvage", "sauvage ", "SAUVAGE", " Sauvage"] * 2        # One cache key
+    results = [None] * len(names)
+
+    def look_up(i):
+        results[i] = cache.get(names[i], "Zurich")
+
+    threads = [threading.Thread(target=look_up, args=(i,)) for i in range(len(names))]
+    for thread in threads:
+        thread.start()
+    _wait_for(lambda: cache.stats['misses'] == len(names))
+    time.sleep(0.05)        # Let the last callers join the running lookup
+    fetch.gate.set()
+    for thread in threads:
+        thread.join(WAIT)
+    assert fetch.calls == 1 and cache.stats['upstream_calls'] == 1
+    assert all(result == results[0] for result in results) and results[0][0]['name'] == "Sauvage shop 1"
+    assert cache.get("sauvage", "zurich") == results[0] and cache.stats['memory_hits'] == 1
+
+
+def test_failed_lookups_are_not_cached(tmp_path):
+    fetch = FakeFetch(fail=True)
+    cache = ShopCache(str(tmp_path / "shops.sqlite3"), fetch=fetch)
+    for _ in range(2):
+        with pytest.raises(ShopLookupError):
+            cache.get("Sauvage")
+    assert fetch.calls == 2
+
+
+def test_fresh_stale_and_expired_entries(tmp_path, clock):
+    fetch = FakeFetch()
+    cache = ShopCache(str(tmp_path / "shops.sqlite3"), ttl=TTL, stale=STALE, fetch=fetch)
+    first = cache.get("Sauvage")
+    clock[0] += TTL - 1
+    assert cache.get("Sauvage") == first and fetch.calls == 1        # Fresh
+
+    clock[0] += 2        # Stale: the old list comes back at once and one background lookup replaces it
+    assert cache.get("Sauvage") == first and cache.stats['stale_hits'] == 1
+    _wait_for(lambda: cache.get("Sauvage") != first and not cache._inflight)
+    assert fetch.calls == 2 and cache.get("Sauvage")[0]['name'] == "Sauvage shop 2"
+
+    clock[0] += TTL + STALE + 1        # Too old to be served: the caller waits for a new lookup
+    assert cache.get("Sauvage")[0]['name'] == "Sauvage shop 3"
+    assert cache.stats['misses'] == 2
+
+
+def test_failed_refresh_keeps_the_stale_entry(tmp_path, clock):
+    fetch = FakeFetch()
+    cache = ShopCache(str(tmp_path / "shops.sqlite3"), ttl=TTL, stale=STALE, fetch=fetch)
+    first = cache.get("Sauvage")
+    clock[0] += TTL + 1
+    fetch.fail = True
+    assert cache.get("Sauvage") == first
+    _wait_for(lambda: fetch.calls == 2 and not cache._inflight)
+    assert cache.get("Sauvage") == first
+
+
+def test_disk_tier_and_purge(tmp_path, clock):
+    path = str(tmp_path / "shops.sqlite3")
+    fetch = FakeFetch()
+    first = ShopCache(path, ttl=TTL, stale=STALE, fetch=fetch).get("Sauvage")
+    restarted = ShopCache(path, ttl=TTL, stale=STALE, fetch=fetch)        # A new process: empty memory tier
+    assert restarted.get("Sauvage") == first and restarted.stats['disk_hits'] == 1 and fetch.calls == 1
+    clock[0] += TTL + STALE + 1
+    restarted.purge()
+    assert not restarted._memory
+    assert ShopCache(path, ttl=TTL, stale=STALE, fetch=fetch).get("Sauvage")[0]['name'] == "Sauvage shop 2"
+
+
+def test_unusable_disk_tier_keeps_the_memory_tier(tmp_path):
+    fetch = FakeFetch()
+    cache = ShopCache(str(tmp_path), fetch=fetch)        # A folder cannot be opened as a database
+    assert cache._db is None
+    assert cache.get("Sauvage") == cache.get("Sauvage") and fetch.calls == 1
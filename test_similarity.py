@@ -0,0 +1,46 @@
+# test_similarity.py to check SimilarityEngine against a plain Python ranking over small seeded catalogs
+
+import pytest        # Import pytest for the parametrization
+
+from similarity import SIGNATURE_COLUMNS, SimilarityEngine
+
+
+def _brute_similar(tags, names, row, k):
+    # Rank every other perfume by shared tags (missing tags never match), then by catalog order
+    scored = []
+    for other in range(len(names)):
+        if other == row or (names[row] is not None and names[other] == names[row]):
+            continue
+        score = sum(1 for column in tags if column[row] is not None and column[other] == column[row])
+        scored.append((-score, other))
+    return [other for _, other in sorted(scored)[:k]]
+
+
+@pytest.mark.parametrize("k", [1, 3, 5])
+@pytest.mark.parametrize("names_from", [None, 'scent_direction'])
+def test_scan_and_precompute(df, values, k, names_from):
+    if names_from:        # Perfumes with the same tag share a name, so precompute() runs out of spare candidates
+        df = df.assign(name=values(df, names_from))
+    engine = SimilarityEngine(df)
+    tags = [values(df, column) for column in SIGNATURE_COLUMNS]
+    names = values(df, 'name')
+    scanned = {row: engine.similar_to_row(row, k).tolist() for row in range(len(df))}
+    for row in range(0, len(df), 7):
+        expected = _brute_similar(tags, names, row, k)
+        assert scanned[row] == expected
+        if names[row] is not None:        # A record is only recognized as itself by its name
+            assert engine.top_k(df.iloc[row], k).tolist() == expected
+    engine.precompute(k)
+    assert engine.complete.any() and (names_from is None or not engine.complete.all())
+    for row in range(len(df)):
+        if engine.complete[row]:
+            found = engine.neighbours[row]
+            assert found[found >= 0].tolist() == scanned[row]
+        assert engine.similar_to_row(row, k).tolist() == scanned[row]
+
+
+def test_unknown_tags_never_match(df):
+    engine = SimilarityEngine(df)
+    record = {'name': "Not In Catalog", **{column: "Not In Catalog" for column in SIGNATURE_COLUMNS}}
+    assert engine.top_k(record, 3).tolist() == [0, 1, 2]        # Every perfume scores 0, so catalog order decides
+    assert engine.scores(engine.encode(record)[0]).max() == 0